@@ -1,12 +1,11 @@
-import os
-import numpy as np
+import io
 import pandas as pd
 import requests
 from datetime import datetime
 from datetime import timedelta
 from loguru import logger
 
-from exonamd.utils import ROOT
+from exonamd.utils import read_db
 
 
 @logger.catch
@@ -22,12 +21,12 @@ def download_nasa_confirmed_planets(
     min_sy_pnum : int, optional
         Minimum number of planets in the system to consider. Defaults to 1.
     from_scratch : bool, optional
-        If True, downloads the entire table. If False, downloads only the rows newer than the latest update date in the current table. Defaults to False.
+        If True, downloads the entire table. If False, downloads only the rows newer than the latest update date in the current table, which is read from exo.parquet if available or from exo.csv otherwise. Defaults to False.
 
     Returns
     -------
     df : pandas.DataFrame
-        The downloaded table.
+        The downloaded table. Host and planet names are stored as categoricals and the update dates as datetimes.
     df_old : pandas.DataFrame
         The previous table, if from_scratch is False. Otherwise, None.
     """
@@ -36,9 +35,10 @@ def download_nasa_confirmed_planets(
         df_old = None
         latest = datetime.strptime("1990-01-01", "%Y-%m-%d")
     else:
-        df_old = pd.read_csv(os.path.join(ROOT, "data", "exo.csv"))
+        df_old = read_db("exo")
+        # The Parquet copy stores datetimes, the CSV file strings
+        df_old["rowupdate"] = pd.to_datetime(df_old["rowupdate"])
         latest = df_old["rowupdate"].max()
-        latest = datetime.strptime(latest, "%Y-%m-%d")
         latest = latest - timedelta(days=1)
     latest = latest.strftime("%Y-%m-%d")
 
@@ -83,7 +83,7 @@ def download_nasa_confirmed_planets(
     url = "https://exoplanetarchive.ipac.caltech.edu/TAP/sync"
     params = {
         "query": query,
-        "format": "json",
+        "format": "csv",
     }
     response = requests.get(url, params=params)
 
@@ -91,9 +91,12 @@ def download_nasa_confirmed_planets(
         logger.error(f"Error: {response.status_code} in fetching data")
         raise ValueError(f"Error: {response.status_code} in fetching data")
 
-    data = response.json()
-    df = pd.DataFrame(data)
-    df = df.replace({None: np.nan, "": np.nan})
+    df = pd.read_csv(io.BytesIO(response.content), na_values=["", "null"])
+
+    logger.debug("Storing host and planet names as categoricals")
+    for col in ["hostname", "pl_name"]:
+        df[col] = df[col].astype("category")
+    df["rowupdate"] = pd.to_datetime(df["rowupdate"], format="%Y-%m-%d")
 
     logger.info("Data fetched")
 
@@ -1,8 +1,17 @@
+import math
 import numpy as np
 import pandas as pd
+from numba import njit
+from numba import prange
 
+DEG2RAD = math.pi / 180.0
+_N_CHUNKS = 64
+# Fast-math flags without nnan/ninf, so that nan inputs and the nan written for
+# rejected samples are propagated and compared exactly
+_FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
 
-def compute_amdk(m, e, di, a):
+
+def compute_amdk(m, e, di, a, sqrt_a=None):
     """
     Compute the angular momentum deficit (AMD) for a planet in a system or for multiple planets.
 
@@ -16,13 +25,75 @@ def compute_amdk(m, e, di, a):
         Relative angle (inclination or obliquity) of the planet's orbit in degrees w.r.t. a reference (e.g. the most massive planet in the system).
     a : float, np.array
         Semi-major axis of the planet's orbit.
+    sqrt_a : float, np.array, optional
+        Square root of the semi-major axis, if already available. By default it is computed from `a`.
 
     Returns
     -------
     amdk : float
         Angular momentum deficit.
+
+    Notes
+    -----
+    For arrays of shape (n_pl, Npt), e.g. Monte Carlo samples, the inputs are broadcast against each other, e.g. per-planet values of shape (n_pl, 1), and the computation is performed in a single pass over all the planets and samples by a compiled kernel.
+
+    The factor 1 - sqrt(1 - e^2) * cos(di) is evaluated as e^2 / (1 + sqrt(1 - e^2)) + sqrt(1 - e^2) * (1 - cos(di)), which is algebraically identical but avoids the cancellation at small eccentricities.
+    """
+    if sqrt_a is None:
+        sqrt_a = np.sqrt(a)
+
+    if max(np.ndim(x) for x in (m, e, di, sqrt_a)) == 2:
+        m, e, di, sqrt_a = np.broadcast_arrays(m, e, di, sqrt_a)
+        out = np.empty(m.shape)
+        # The kernel runs over the flattened arrays, which must be contiguous
+        _amdk_kernel(
+            *(np.ascontiguousarray(x, dtype=float).ravel() for x in (m, e, di, sqrt_a)),
+            out.ravel(),
+        )
+        return out
+
+    e2 = e * e
+    s = np.sqrt(1 - e2)
+    return m * sqrt_a * (e2 / (1 + s) + s * (1 - np.cos(di * DEG2RAD)))
+
+
+def sample_namd_rejection(loc, scale, di_upper, Npt, amdk_factor=1.0, seed=None):
     """
-    return m * np.sqrt(a) * (1 - np.sqrt(1 - e**2) * np.cos(np.deg2rad(di)))
+    Sample the normalized angular momentum deficit (NAMD) of a system drawing the parameters from normal distributions, rejecting the unphysical samples.
+
+    The parameters are drawn, checked and reduced to the NAMD inside a compiled kernel, so that the parameter samples are never stored in memory.
+
+    Parameters
+    ----------
+    loc : np.array
+        Array of shape (4, n_pl) with the mean mass, eccentricity, relative angle (in degrees) and semi-major axis of the planets in the system.
+    scale : np.array
+        Array of shape (4, n_pl) with the standard deviations of the parameters in `loc`.
+    di_upper : float
+        Upper bound (excluded) for the relative angle, in degrees.
+    Npt : int
+        Number of Monte Carlo samples.
+    amdk_factor : float, optional
+        Factor multiplying the AMD of each planet, by default 1.0.
+    seed : int, np.random.Generator or None, optional
+        Seed (or generator) for the random number generator.
+
+    Returns
+    -------
+    namd : np.array
+        Normalized angular momentum deficit for the samples that are physical for all the planets in the system.
+
+    Notes
+    -----
+    The samples are split in a fixed number of chunks, each drawn from its own seeded stream, so that the result does not depend on the number of threads.
+    """
+    rng = np.random.default_rng(seed)
+    seeds = rng.integers(0, 2**32, size=_N_CHUNKS)
+    out = np.empty(Npt)
+    valid = np.empty(Npt, dtype=np.bool_)
+    _namd_rejection_kernel(loc, scale, di_upper, amdk_factor, seeds, out, valid)
+
+    return out[valid]
 
 
 def compute_namd(amdk, m, sqrt_a):
@@ -32,7 +103,7 @@ def compute_namd(amdk, m, sqrt_a):
     Parameters
     ----------
     amdk : np.array
-        Angular momentum deficit for the planets in a system.
+        Angular momentum deficit for the planets in a system. Can also be an array of shape (n_pl, Npt), e.g. from Monte Carlo sampling.
     m : np.array
         Mass of the planets in the system
     sqrt_a : np.array
@@ -40,8 +111,105 @@ def compute_namd(amdk, m, sqrt_a):
 
     Returns
     -------
-    namd : float
-        Normalized angular momentum deficit.
+    namd : float, np.array
+        Normalized angular momentum deficit. If the inputs are 2D, an array of shape (Npt,).
+    """
+
+    # Contract the planet axis of m * sqrt_a without building the product
+    return np.sum(amdk, axis=0) / np.einsum("p...,p...->...", m, sqrt_a)
+
+
+def compute_namd_mc(m, e, di, a, amdk_factor=1.0):
+    """
+    Compute the normalized angular momentum deficit (NAMD) for Monte Carlo samples of the parameters of the planets in a system.
+
+    The AMD of each planet and the normalization are accumulated sample by sample inside a compiled kernel, so that no intermediate (n_pl, Npt) array is stored.
+
+    Parameters
+    ----------
+    m : np.array
+        Array of shape (n_pl, Npt) with the mass samples.
+    e : np.array
+        Array of shape (n_pl, Npt) with the eccentricity samples.
+    di : np.array
+        Array of shape (n_pl, Npt) with the relative angle samples, in degrees.
+    a : np.array
+        Array of shape (n_pl, Npt) with the semi-major axis samples.
+    amdk_factor : float, optional
+        Factor multiplying the AMD of each planet, by default 1.0.
+
+    Returns
+    -------
+    namd : np.array
+        Normalized angular momentum deficit, of shape (Npt,).
+    """
+    out = np.empty(m.shape[1])
+    _namd_mc_kernel(m, e, di, a, amdk_factor, out)
+    return out
+
+
+@njit(fastmath=_FASTMATH, cache=True)
+def _amdk_scalar(m, e, di, sqrt_a):
+    """
+    Compiled version of **compute_amdk** for a single planet and sample.
     """
+    e2 = e * e
+    s = math.sqrt(1.0 - e2)
+    return m * sqrt_a * (e2 / (1.0 + s) + s * (1.0 - math.cos(di * DEG2RAD)))
 
-    return np.sum(amdk) / np.sum(m * sqrt_a)
+
+@njit(parallel=True, fastmath=_FASTMATH, cache=True)
+def _amdk_kernel(m, e, di, sqrt_a, out):
+    """
+    Compiled version of **compute_amdk** for flattened arrays of the same size, evaluated in a single pass over all the planets and samples.
+    """
+    for k in prange(out.shape[0]):
+        out[k] = _amdk_scalar(m[k], e[k], di[k], sqrt_a[k])
+
+
+@njit(parallel=True, fastmath=_FASTMATH, cache=True)
+def _namd_mc_kernel(m, e, di, a, amdk_factor, out):
+    """
+    Compiled kernel of **compute_namd_mc**, reducing over the planets for each sample.
+    """
+    n_pl, Npt = m.shape
+    for j in prange(Npt):
+        num = 0.0
+        den = 0.0
+        for i in range(n_pl):
+            sqrt_a = math.sqrt(a[i, j])
+            num += amdk_factor * _amdk_scalar(m[i, j], e[i, j], di[i, j], sqrt_a)
+            den += m[i, j] * sqrt_a
+        out[j] = num / den
+
+
+@njit(parallel=True, fastmath=_FASTMATH, cache=True)
+def _namd_rejection_kernel(loc, scale, di_upper, amdk_factor, seeds, out, valid):
+    """
+    Compiled kernel of **sample_namd_rejection**. Each chunk of samples reseeds the random number generator of the thread running it.
+    """
+    n_pl = loc.shape[1]
+    Npt = out.shape[0]
+    n_chunks = seeds.shape[0]
+    chunk = (Npt + n_chunks - 1) // n_chunks
+    for c in prange(n_chunks):
+        np.random.seed(seeds[c])
+        for j in range(c * chunk, min((c + 1) * chunk, Npt)):
+            num = 0.0
+            den = 0.0
+            good = True
+            for i in range(n_pl):
+                m = loc[0, i] + scale[0, i] * np.random.standard_normal()
+                e = loc[1, i] + scale[1, i] * np.random.standard_normal()
+                di = loc[2, i] + scale[2, i] * np.random.standard_normal()
+                a = loc[3, i] + scale[3, i] * np.random.standard_normal()
+                if not (
+                    m > 0.0 and 0.0 <= e < 1.0 and 0.0 <= di < di_upper and a > 0.0
+                ):
+                    good = False
+                    break
+                sqrt_a = math.sqrt(a)
+                num += amdk_factor * _amdk_scalar(m, e, di, sqrt_a)
+                den += m * sqrt_a
+            valid[j] = good
+            out[j] = num / den if good else np.nan
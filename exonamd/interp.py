@@ -1,71 +1,101 @@
+import functools
 import numpy as np
 import pandas as pd
 from spright import RMRelation
 from loguru import logger
 
-from exonamd.utils import get_value
+from exonamd.utils import FLAG_BITS
 
 
-rmr = RMRelation()
+@functools.lru_cache(maxsize=1)
+def _get_rmr():
+    """
+    Instantiate the spright mass-radius relation on first use, so that importing this module (e.g. in worker processes) does not load it.
+    """
+    return RMRelation()
+
+
+@functools.lru_cache(maxsize=4096)
+def _predict_mass_quantiles(radius, radiuserr):
+    """
+    Predict the 16th, 50th and 84th percentiles of the mass of a planet with the spright mass-radius relation.
+
+    The predictions are cached, so that planets sharing the same (rounded) radius and uncertainty are only evaluated once.
+
+    Parameters
+    ----------
+    radius : float
+        Radius in units of R_earth.
+    radiuserr : float
+        Radius uncertainty in units of R_earth.
+
+    Returns
+    -------
+    tuple
+        The 16th, 50th and 84th percentiles of the predicted mass in units of M_earth.
+    """
+    mds = _get_rmr().predict_mass(radius=(radius, radiuserr))
+    return tuple(np.quantile(mds.samples, [0.16, 0.5, 0.84]))
 
 
 @logger.catch
-def interp_eccentricity(row):
+def interp_eccentricity(df):
     """
     Interpolates missing eccentricity values using the relation found in
     ...
 
     Also, sets flags for the interpolation.
 
+    The interpolation is vectorized over the whole table.
+
     Parameters
     ----------
-    row: pandas.Series
-        The planet row in the sytem table.
+    df: pandas.DataFrame
+        The system table.
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the interpolated eccentricity, the associated uncertainties and flag.
+    pandas.DataFrame
+        A pandas DataFrame containing the interpolated eccentricity, the associated uncertainties and flag bits.
     """
-    ecc = get_value(row["pl_orbeccen"])
-    eccerr1 = get_value(row["pl_orbeccenerr1"])
-    eccerr2 = get_value(row["pl_orbeccenerr2"])
-    flag = get_value(row["flag"])
-    sy_pnum = get_value(row["sy_pnum"])
-
-    if np.isnan(ecc):
-        ecc = 0.63 * sy_pnum ** (-1.02)
-        eccerr1 = 0.0
-        eccerr2 = 0.0
-        flag += "1+-"
-
-    if np.isnan(eccerr1):
-        eccerr1 = 0.0
-        flag += "1+"
-
-    if np.isnan(eccerr2):
-        eccerr2 = 0.0
-        flag += "1-"
+    ecc = df["pl_orbeccen"].to_numpy(dtype=float)
+    eccerr1 = df["pl_orbeccenerr1"].to_numpy(dtype=float)
+    eccerr2 = df["pl_orbeccenerr2"].to_numpy(dtype=float)
+    sy_pnum = df["sy_pnum"].to_numpy(dtype=float)
+
+    nan_ecc = np.isnan(ecc)
+    nan_err1 = ~nan_ecc & np.isnan(eccerr1)
+    nan_err2 = ~nan_ecc & np.isnan(eccerr2)
+
+    ecc = np.where(nan_ecc, 0.63 * sy_pnum ** (-1.02), ecc)
+    eccerr1 = np.where(nan_ecc | nan_err1, 0.0, eccerr1)
+    eccerr2 = np.where(nan_ecc | nan_err2, 0.0, eccerr2)
+    flag_bits = df["flag_bits"].to_numpy(dtype=np.uint32, copy=True)
+    flag_bits[nan_ecc] |= FLAG_BITS["1+-"]
+    flag_bits[nan_err1] |= FLAG_BITS["1+"]
+    flag_bits[nan_err2] |= FLAG_BITS["1-"]
 
     out = {
         "pl_orbeccen": ecc,
         "pl_orbeccenerr1": eccerr1,
         "pl_orbeccenerr2": eccerr2,
-        "flag": flag,
+        "flag_bits": flag_bits,
     }
 
-    return pd.Series(out)
+    return pd.DataFrame(out, index=df.index)
 
 
 @logger.catch
-def interp_mass(row, min_radius=0.5, max_radius=6.0):
+def interp_mass(df, min_radius=0.5, max_radius=6.0):
     """
     Interpolate missing mass values by using the mass-radius relation implemented in the spright package, which is described in https://spright.readthedocs.io/en/latest/.
 
+    The relation is only evaluated for the planets that qualify for the interpolation.
+
     Parameters
     ----------
-    row : pandas.Series
-        The planet row in the sytem table.
+    df : pandas.DataFrame
+        The system table.
     min_radius : float, optional
         Minimum radius in units of R_earth below which the interpolation is not performed, by default 0.5.
     max_radius : float, optional
@@ -73,94 +103,97 @@ def interp_mass(row, min_radius=0.5, max_radius=6.0):
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the interpolated mass, the associated uncertainties and flag.
+    pandas.DataFrame
+        A pandas DataFrame containing the interpolated mass, the associated uncertainties and flag bits.
     """
-    mass = get_value(row["pl_bmasse"])
-    masserr1 = get_value(row["pl_bmasseerr1"])
-    masserr2 = get_value(row["pl_bmasseerr2"])
-    radius = get_value(row["pl_rade"])
-    radiuserr1 = get_value(row["pl_radeerr1"])
-    radiuserr2 = get_value(row["pl_radeerr2"])
-    flag = get_value(row["flag"])
-
-    if (
+    mass = df["pl_bmasse"].to_numpy(dtype=float, copy=True)
+    masserr1 = df["pl_bmasseerr1"].to_numpy(dtype=float, copy=True)
+    masserr2 = df["pl_bmasseerr2"].to_numpy(dtype=float, copy=True)
+    radius = df["pl_rade"].to_numpy(dtype=float)
+    radiuserr1 = df["pl_radeerr1"].to_numpy(dtype=float)
+    radiuserr2 = df["pl_radeerr2"].to_numpy(dtype=float)
+
+    todo = (
         np.isnan(mass)
-        and not np.isnan(radius)
-        and radius > min_radius
-        and radius < max_radius
-        and not np.isnan(radiuserr1)
-        and not np.isnan(radiuserr2)
-    ):
-        mds = rmr.predict_mass(radius=(radius, 0.5 * (radiuserr1 - radiuserr2)))
-        q16, q50, q84 = np.percentile(mds.samples, [16, 50, 84])
-        mass = q50
-        masserr1 = q84 - q50
-        masserr2 = q16 - q50
-        flag += "2+-"
-
-    if np.isnan(masserr1):
-        masserr1 = 0.0
-        flag += "2+"
-
-    if np.isnan(masserr2):
-        masserr2 = 0.0
-        flag += "2-"
+        & ~np.isnan(radius)
+        & (radius > min_radius)
+        & (radius < max_radius)
+        & ~np.isnan(radiuserr1)
+        & ~np.isnan(radiuserr2)
+    )
+    idx = np.flatnonzero(todo)
+
+    if len(idx) > 0:
+        # spright predicts one radius at a time and may return a different
+        # number of samples for each one, so only the quantiles are stacked
+        keys = zip(
+            np.round(radius[idx], 3),
+            np.round(0.5 * (radiuserr1[idx] - radiuserr2[idx]), 4),
+        )
+        q16, q50, q84 = np.array(
+            [_predict_mass_quantiles(float(r), float(rerr)) for r, rerr in keys]
+        ).T
+        mass[idx] = q50
+        masserr1[idx] = q84 - q50
+        masserr2[idx] = q16 - q50
+
+    nan_err1 = np.isnan(masserr1)
+    nan_err2 = np.isnan(masserr2)
+    masserr1[nan_err1] = 0.0
+    masserr2[nan_err2] = 0.0
+    flag_bits = df["flag_bits"].to_numpy(dtype=np.uint32, copy=True)
+    flag_bits[todo] |= FLAG_BITS["2+-"]
+    flag_bits[nan_err1] |= FLAG_BITS["2+"]
+    flag_bits[nan_err2] |= FLAG_BITS["2-"]
 
     out = {
         "pl_bmasse": mass,
         "pl_bmasseerr1": masserr1,
         "pl_bmasseerr2": masserr2,
-        "flag": flag,
+        "flag_bits": flag_bits,
     }
 
-    return pd.Series(out)
+    return pd.DataFrame(out, index=df.index)
 
 
 @logger.catch
-def interp_sma(row):
+def interp_sma(df):
     """
     Interpolate missing semi-major axis uncertainties by setting them to zero and adding the flag.
 
+    The interpolation is vectorized over the whole table.
+
     Parameters
     ----------
-    row : pandas.Series
-        The planet row in the sytem table.
+    df : pandas.DataFrame
+        The system table.
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the interpolated semi-major axis uncertainties and the associated flag.
+    pandas.DataFrame
+        A pandas DataFrame containing the interpolated semi-major axis uncertainties and the associated flag bits.
     """
-    smaerr1 = get_value(row["pl_orbsmaxerr1"])
-    smaerr2 = get_value(row["pl_orbsmaxerr2"])
-    flag = get_value(row["flag"])
-
-    if np.isnan(smaerr1):
-        smaerr1 = 0.0
-        flag += "4+"
-
-    if np.isnan(smaerr2):
-        smaerr2 = 0.0
-        flag += "4-"
+    flag_bits = df["flag_bits"].to_numpy(dtype=np.uint32, copy=True)
+    flag_bits[df["pl_orbsmaxerr1"].isna().to_numpy()] |= FLAG_BITS["4+"]
+    flag_bits[df["pl_orbsmaxerr2"].isna().to_numpy()] |= FLAG_BITS["4-"]
 
     out = {
-        "pl_orbsmaxerr1": smaerr1,
-        "pl_orbsmaxerr2": smaerr2,
-        "flag": flag,
+        "pl_orbsmaxerr1": df["pl_orbsmaxerr1"].fillna(0.0),
+        "pl_orbsmaxerr2": df["pl_orbsmaxerr2"].fillna(0.0),
+        "flag_bits": flag_bits,
     }
 
-    return pd.Series(out)
+    return pd.DataFrame(out, index=df.index)
 
 
-def interpolate_angle(row, df, value_type):
+def interpolate_angle(df, value_type):
     """
     Interpolate missing values for inclination or obliquity by using the values from the most massive planet in the same system.
 
+    The interpolation is vectorized over the whole table: the reference planet of each system is found once, and then broadcast to its planets.
+
     Parameters
     ----------
-    row : pandas.Series
-        The planet row in the sytem table.
     df : pandas.DataFrame
         The system table.
     value_type : str
@@ -168,114 +201,105 @@ def interpolate_angle(row, df, value_type):
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the interpolated value, the associated uncertainties and flag.
+    pandas.DataFrame
+        A pandas DataFrame containing the interpolated value, the associated uncertainties and flag bits.
     """
-    hostname = get_value(row["hostname"])
-    flag = get_value(row["flag"])
-
     if value_type == "inclination":
         value_col = "pl_orbincl"
         err1_col = "pl_orbinclerr1"
         err2_col = "pl_orbinclerr2"
-        backup_value = 90.0
-        backup_err1 = 0.0
-        backup_err2 = 0.0
+        backup_value = np.full(len(df), 90.0)
+        backup_err1 = np.zeros(len(df))
+        backup_err2 = np.zeros(len(df))
         flag_suffix = "3"
     elif value_type == "obliquity":
         value_col = "pl_trueobliq"
         err1_col = "pl_trueobliqerr1"
         err2_col = "pl_trueobliqerr2"
-        backup_value = get_value(row["pl_relincl"])
-        backup_err1 = get_value(row["pl_relinclerr1"])
-        backup_err2 = get_value(row["pl_relinclerr2"])
+        backup_value = df["pl_relincl"].to_numpy(dtype=float)
+        backup_err1 = df["pl_relinclerr1"].to_numpy(dtype=float)
+        backup_err2 = df["pl_relinclerr2"].to_numpy(dtype=float)
         flag_suffix = "5"
     else:
         raise ValueError("Invalid value_type provided")
 
-    value = get_value(row[value_col])
-    err1 = get_value(row[err1_col])
-    err2 = get_value(row[err2_col])
-
-    host = df[df["hostname"] == hostname]
-    max_mass_idx = host["pl_bmasse"].idxmax()
-    valuenan = host[host[value_col].isnull()]
-
-    # if value is not nan, check the errors
-    # if they are nan, set them to 0
-    if not np.isnan(value):
-        if np.isnan(err1):
-            err1 = 0.0
-            flag += f"{flag_suffix}+"
-        if np.isnan(err2):
-            err2 = 0.0
-            flag += f"{flag_suffix}-"
-
-    elif len(valuenan) == len(host):
-        # if all planets have value nan
-        value = backup_value
-        err1 = backup_err1
-        err2 = backup_err2
-        flag += f"{flag_suffix}d+-"
-
-    else:
-        if max_mass_idx in valuenan.index:
-            # if the most massive planet has value nan
-            # we go to the next most massive planet
-            nonan_values = host[host[value_col].notnull()]
-            max_mass_idx = nonan_values["pl_bmasse"].idxmax()
-
-        max_mass = host.loc[max_mass_idx, [value_col, err1_col, err2_col]]
-        value = max_mass[value_col]
-        err1 = max_mass[err1_col] if not np.isnan(max_mass[err1_col]) else 0.0
-        err2 = max_mass[err2_col] if not np.isnan(max_mass[err2_col]) else 0.0
-        flag += f"{flag_suffix}+-"
+    cols = [value_col, err1_col, err2_col]
+    value, err1, err2 = df[cols].to_numpy(dtype=float).T
+    has_value = ~np.isnan(value)
+
+    # the reference planet of each system is the most massive one with a value
+    mass = df.loc[has_value, "pl_bmasse"].fillna(-np.inf)
+    ref_idx = mass.groupby(df.loc[has_value, "hostname"], observed=True).idxmax()
+    ref = df.loc[ref_idx, cols].set_axis(ref_idx.index)
+    ref_value, ref_err1, ref_err2 = ref.reindex(df["hostname"]).to_numpy(dtype=float).T
+
+    # if the value is not nan, check the errors: if they are nan, set them to 0
+    nan_err1 = has_value & np.isnan(err1)
+    nan_err2 = has_value & np.isnan(err2)
+    # if all planets have value nan, use the backup values
+    all_nan = np.isnan(ref_value)
+    # otherwise, use the values of the reference planet
+    interp = ~has_value & ~all_nan
+
+    value = np.select([has_value, all_nan], [value, backup_value], ref_value)
+    err1 = np.select(
+        [has_value, all_nan],
+        [np.nan_to_num(err1), backup_err1],
+        np.nan_to_num(ref_err1),
+    )
+    err2 = np.select(
+        [has_value, all_nan],
+        [np.nan_to_num(err2), backup_err2],
+        np.nan_to_num(ref_err2),
+    )
+
+    flag_bits = df["flag_bits"].to_numpy(dtype=np.uint32, copy=True)
+    flag_bits[nan_err1] |= FLAG_BITS[f"{flag_suffix}+"]
+    flag_bits[nan_err2] |= FLAG_BITS[f"{flag_suffix}-"]
+    flag_bits[all_nan] |= FLAG_BITS[f"{flag_suffix}d+-"]
+    flag_bits[interp] |= FLAG_BITS[f"{flag_suffix}+-"]
 
     out = {
         value_col: value,
         err1_col: err1,
         err2_col: err2,
-        "flag": flag,
+        "flag_bits": flag_bits,
     }
 
-    return pd.Series(out)
+    return pd.DataFrame(out, index=df.index)
 
 
 @logger.catch
-def interp_inclination(row, df):
+def interp_inclination(df):
     """
     Wrapper of the function **interpolate_angle** to interpolate inclination by using the values from the most massive planet in the same system.
 
     Parameters
     ----------
-    row : pandas.Series
-        The planet row in the sytem table.
     df : pandas.DataFrame
         The system table.
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the interpolated value, the associated uncertainties and flag.
+    pandas.DataFrame
+        A pandas DataFrame containing the interpolated value, the associated uncertainties and flag bits.
     """
-    return interpolate_angle(row, df, "inclination")
+    return interpolate_angle(df, "inclination")
 
 
 @logger.catch
-def interp_trueobliq(row, df):
+def interp_trueobliq(df):
     """
     Wrapper of the function **interpolate_angle** to interpolate obliquity by using the values from the most massive planet in the same system.
 
     Parameters
     ----------
-    row : pandas.Series
-        The planet row in the sytem table.
     df : pandas.DataFrame
         The system table.
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the interpolated value, the associated uncertainties and flag.
+    pandas.DataFrame
+        A pandas DataFrame containing the interpolated value, the associated uncertainties and flag bits.
     """
-    return interpolate_angle(row, df, "obliquity")
+    return interpolate_angle(df, "obliquity")
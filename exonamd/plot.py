@@ -1,4 +1,3 @@
-import os
 from pathlib import Path
 import numpy as np
 import pandas as pd
@@ -8,7 +7,7 @@ from matplotlib.ticker import LogLocator, FuncFormatter, NullFormatter
 
 from loguru import logger
 
-from exonamd.utils import ROOT
+from exonamd.utils import read_db
 from exonamd.solve import solve_namd_mc
 
 # set the default fontsizes
@@ -49,8 +48,8 @@ def simple_plot(
         xlabel = rf"{kind[0].upper()}-{which.upper()}"
 
     if scale == "log":
-        samples = np.log10(samples)
-        q16, q50, q84 = np.percentile(samples, [16, 50, 84])
+        samples = np.log10(np.asarray(samples, dtype=float))
+        q16, q50, q84 = np.quantile(samples, [0.16, 0.5, 0.84])
         xlabel = rf"log$\,${xlabel}"
 
     errup = q84 - q50
@@ -65,7 +64,7 @@ def simple_plot(
         samples,
         bins=bins,
         histtype="step",
-        weights=np.ones_like(samples) / len(samples),
+        weights=np.full(np.shape(samples), 1.0 / len(samples)),
     )
     if grid:
         plt.grid(which="both", linestyle="--", alpha=0.5)
@@ -128,15 +127,16 @@ def pop_plot(
 
     ylabel = rf"{kind[0].upper()}-{which.upper()}"
 
+    unique_m = np.unique(sy_pnum.to_numpy())
     coeffs = np.polyfit(sy_pnum, q50, 1)
-    line = np.polyval(coeffs, np.array(list(set(sy_pnum))))
+    line = np.polyval(coeffs, unique_m)
     if yscale == "log":
         coeffs = np.polyfit(sy_pnum, np.log10(q50), 1)
-        line = 10 ** np.polyval(coeffs, np.array(list(set(sy_pnum))))
+        line = 10 ** np.polyval(coeffs, unique_m)
 
     plt.figure(figsize=(6, 6))
     plt.plot(
-        np.array(list(set(sy_pnum))),
+        unique_m,
         line,
         "k--",
         alpha=0.5,
@@ -145,16 +145,13 @@ def pop_plot(
     )
 
     if xoffs > 0.0:
-        M = set(sy_pnum)
-        n_list = []
-        for m in M:
-            idx = sy_pnum == m
-            n_list.append(idx.sum())
-        n_list = np.array(n_list)
-        xoffs = xoffs * n_list / n_list.max()
-        for i, m in enumerate(M):
-            idx = sy_pnum == m
-            sy_pnum[idx] += np.linspace(-xoffs[i], xoffs[i], idx.sum())
+        codes = np.searchsorted(unique_m, sy_pnum.to_numpy())
+        n_list = np.bincount(codes)
+        xoffs = (xoffs * n_list / n_list.max())[codes]
+        n_list = n_list[codes]
+        ranks = sy_pnum.groupby(codes).cumcount().to_numpy()
+        # Spread each multiplicity evenly over [-xoffs, xoffs], as np.linspace
+        sy_pnum = sy_pnum + xoffs * (2 * ranks / np.maximum(n_list - 1, 1) - 1)
 
     plt.errorbar(
         sy_pnum[~replaced_idx],
@@ -244,7 +241,7 @@ def plot_host_namd(
     # Task 1: reload database
     if df is None:
         logger.info("Reloading the database")
-        df = pd.read_csv(os.path.join(ROOT, "data", "exo_namd.csv"))
+        df = read_db("exo_namd")
         logger.info("Database reloaded")
 
     # Task 1: sample the NAMD for a given host
@@ -255,7 +252,7 @@ def plot_host_namd(
     logger.info("Computing the Monte Carlo relative NAMD")
     retval = solve_namd_mc(
         host=host,
-        kind=f"{kind}",
+        kind=kind,
         Npt=Npt,
         threshold=threshold,
         use_trunc_normal=True,
@@ -267,7 +264,7 @@ def plot_host_namd(
     logger.info("Plotting the relative NAMD distribution")
     simple_plot(
         df=retval,
-        kind=f"{kind}",
+        kind=kind,
         title=hostname,
         which="namd",
         scale="log",
@@ -302,15 +299,14 @@ def plot_sample_namd(
     # Task 1: reload database
     if df is None:
         logger.info("Reloading the database")
-        df = pd.read_csv(os.path.join(ROOT, "data", "exo_namd.csv"))
+        df = read_db("exo_namd")
         logger.info("Database reloaded")
 
     # Task 2: plot the sample NAMD
     logger.info("Plotting the NAMD vs. multiplicity")
+    num_cols = df.select_dtypes("number").columns
     pop_plot(
-        df=df.groupby("hostname").apply(
-            lambda g: g.select_dtypes(exclude=["object"]).mean(),
-        ),
+        df=df.groupby("hostname", observed=True)[num_cols].mean(),
         kind=kind,
         title=title,
         which="namd",
@@ -1,16 +1,19 @@
 import os
 import numpy as np
 import pandas as pd
-import swifter
 import warnings
 from loguru import logger
 
 from exonamd.catalog import download_nasa_confirmed_planets
 from exonamd.utils import ROOT
 from exonamd.utils import fetch_aliases
-from exonamd.utils import update_host
-from exonamd.utils import update_planet
+from exonamd.utils import host_alias_map
+from exonamd.utils import planet_alias_map
 from exonamd.utils import check_name
+from exonamd.utils import read_db
+from exonamd.utils import write_db
+from exonamd.utils import decode_flag_bits
+from exonamd.utils import FLAG_BITS
 from exonamd.solve import solve_values
 from exonamd.interp import interp_eccentricity
 from exonamd.interp import interp_mass
@@ -28,15 +31,6 @@ warnings.filterwarnings("ignore", category=RuntimeWarning, module="pandas")
 pd.options.display.max_columns = 20
 pd.options.display.max_rows = 30
 pd.options.mode.copy_on_write = True
-swifter.set_defaults(
-    npartitions=None,
-    dask_threshold=1,
-    scheduler="processes",
-    progress_bar=True,
-    progress_bar_desc=None,
-    allow_dask_on_strings=False,
-    force_parallel=False,
-)
 
 
 __all__ = [
@@ -55,7 +49,7 @@ def create_db(from_scratch=True, out_path=""):
     from_scratch : bool, optional
         If True, downloads the entire table. If False, downloads only the rows newer than the latest update date in the current table. Defaults to True.
     out_path : str, optional
-        The path where the curated database will be stored. If empty, the default path will be used.
+        The path where the curated database will be stored in CSV format. If empty, the default path will be used. A Parquet copy, which is faster to reload, is stored alongside it.
 
     Returns
     -------
@@ -69,36 +63,27 @@ def create_db(from_scratch=True, out_path=""):
     )
 
     # Task 2: deal with the aliases
-    out_path = os.path.join(ROOT, "data", "aliases.pkl")
+    aliases_path = os.path.join(ROOT, "data", "aliases.pkl")
     aliases = fetch_aliases(
         hosts=df["hostname"].unique(),
-        output_file=out_path,
+        output_file=aliases_path,
     )
 
     logger.info("Updating host and planet names")
-    df["hostname"] = df.swifter.apply(update_host, args=(aliases,), axis=1)
-    df["pl_name"] = df.swifter.apply(update_planet, args=(aliases,), axis=1)
+    df["hostname"] = df["hostname"].map(host_alias_map(aliases)).fillna(df["hostname"])
+    df["pl_name"] = df["pl_name"].map(planet_alias_map(aliases)).fillna(df["pl_name"])
     logger.info("Names updated")
 
     logger.info("Checking consistency of planet names")
-    name_ok = df.groupby("hostname")["pl_name"].apply(check_name)
+    name_ok = df.groupby("hostname", observed=True)["pl_name"].apply(check_name)
     for hostname in name_ok[~name_ok].index:
         logger.error(f"Inconsistent planet names for {hostname}")
     logger.info("Consistency check done")
 
     # Task 3: compute missing values (if any) from simple relations
     logger.info("Computing missing values from simple relations")
-    df[
-        [
-            "pl_orbsmax",
-            "pl_ratdor",
-            "st_rad",
-            "pl_rade",
-            "pl_ratror",
-            "pl_orbper",
-            "st_mass",
-        ]
-    ] = df.swifter.apply(solve_values, axis=1)
+    solved = solve_values(df)
+    df[solved.columns] = solved
     logger.info("Missing values computed")
 
     # Task 4: store the curated database
@@ -117,13 +102,15 @@ def create_db(from_scratch=True, out_path=""):
 
     logger.info("Storing the curated database")
     if df_old is not None:
-        df = pd.concat([df.copy(), df_old], ignore_index=True)
+        # only the old rows in the re-downloaded date range can be duplicates
+        recent = df_old["rowupdate"] >= df["rowupdate"].min()
+        df = pd.concat([df, df_old[recent]], ignore_index=True)
         df = df.drop_duplicates(keep="last")
-        df.reset_index(drop=True)
+        df = pd.concat([df, df_old[~recent]], ignore_index=True)
 
     if out_path == "":
         out_path = os.path.join(ROOT, "data", "exo.csv")
-    df.to_csv(out_path, index=False)
+    write_db(df, out_path)
     logger.info(f"Database stored at {out_path}")
 
     return df
@@ -145,7 +132,7 @@ def interp_db(df: pd.DataFrame, out_path=""):
     Parameters
     ----------
     df : pd.DataFrame
-        The database to be curated and interpolated. If None, the function will reload the database.
+        The database to be curated and interpolated. If None, the function will reload the database, from exo.parquet if available or from exo.csv otherwise.
     out_path : str, optional
         The path where the curated+interpolated database will be stored. If empty, the default path will be used.
 
@@ -161,14 +148,17 @@ def interp_db(df: pd.DataFrame, out_path=""):
 
     Notes
     -----
-    The output database will have the same columns as the input database, with the addition of the "flag" column which indicates whether the value was interpolated or not (flag=0).
+    The output database will have the same columns as the input database, with the addition of the "flag" column which indicates whether the value was interpolated or not (flag=0), and of the "flag_bits" column which holds the same flags as bits (see **FLAG_BITS**).
     """
     # Task 1: reload database
     if df is None:
         logger.info("Reloading the database")
-        df = pd.read_csv(os.path.join(ROOT, "data", "exo.csv"))
+        df = read_db("exo")
         logger.info("Database reloaded")
 
+    logger.debug("Storing host and planet names as categoricals")
+    df = df.astype({"hostname": "category", "pl_name": "category"})
+
     # Task 2: input missing values (if any) by interpolation
     logger.info("Thinning down the data with nanmedian")
     NaT_idx = df[df["rowupdate"].isna()].index
@@ -176,11 +166,12 @@ def interp_db(df: pd.DataFrame, out_path=""):
         logger.warning(f"NaT values in rowupdate: {len(NaT_idx)}")
         df.loc[NaT_idx, "rowupdate"] = pd.to_datetime("1900-01-01")
     df["rowupdate"] = pd.to_datetime(df["rowupdate"], format="%Y-%m-%d")
-    latest_update_idx = df.groupby("pl_name")["rowupdate"].idxmax()
+    latest_update_idx = df.groupby("pl_name", observed=True)["rowupdate"].idxmax()
 
     cols = df.columns.difference(["hostname", "pl_name", "default_flag", "rowupdate"])
-    medians = df.groupby("pl_name")[cols].transform(np.nanmedian)
-    df.loc[latest_update_idx, cols] = medians.loc[latest_update_idx]
+    # one median per planet, aligned with latest_update_idx as both are sorted by pl_name
+    medians = df.groupby("pl_name", observed=True)[cols].median()
+    df.loc[latest_update_idx, cols] = medians.set_axis(latest_update_idx.to_numpy())
     df = df.loc[latest_update_idx].drop(columns="default_flag")
     logger.info("Data thinned down")
 
@@ -195,7 +186,7 @@ def interp_db(df: pd.DataFrame, out_path=""):
     logger.info("No duplicates found")
 
     logger.info("Instantiating the flags")
-    df["flag"] = "0"
+    df["flag_bits"] = np.zeros(len(df), dtype=np.uint32)
     logger.info("Flags instantiated")
 
     logger.info("Interpolating missing eccentricity values")
@@ -204,9 +195,9 @@ def interp_db(df: pd.DataFrame, out_path=""):
             "pl_orbeccen",
             "pl_orbeccenerr1",
             "pl_orbeccenerr2",
-            "flag",
+            "flag_bits",
         ]
-    ] = df.swifter.apply(interp_eccentricity, axis=1)
+    ] = interp_eccentricity(df)
     logger.info("Values interpolated")
 
     logger.info("Interpolating missing planetary mass values")
@@ -215,9 +206,9 @@ def interp_db(df: pd.DataFrame, out_path=""):
             "pl_bmasse",
             "pl_bmasseerr1",
             "pl_bmasseerr2",
-            "flag",
+            "flag_bits",
         ]
-    ] = df.swifter.apply(interp_mass, axis=1)
+    ] = interp_mass(df)
     logger.info("Values interpolated")
 
     logger.debug("Dropping columns that are no longer needed")
@@ -227,11 +218,8 @@ def interp_db(df: pd.DataFrame, out_path=""):
     logger.info(
         "Removing systems where at least one planet has no mass or semi-major axis"
     )
-    mask = (
-        df.groupby("hostname")[["pl_bmasse", "pl_orbsmax"]]
-        .transform(lambda x: x.isnull().any())
-        .any(axis=1)
-    )
+    null_any = df[["pl_bmasse", "pl_orbsmax"]].isna().any(axis=1)
+    mask = null_any.groupby(df["hostname"], observed=True).transform("any")
     rm_systems = df[mask]["hostname"].unique()
     logger.info(f"Removing {len(rm_systems)} systems: {rm_systems}")
     df = df[~mask]
@@ -243,9 +231,9 @@ def interp_db(df: pd.DataFrame, out_path=""):
             "pl_orbincl",
             "pl_orbinclerr1",
             "pl_orbinclerr2",
-            "flag",
+            "flag_bits",
         ]
-    ] = df.swifter.apply(interp_inclination, args=(df,), axis=1)
+    ] = interp_inclination(df)
     logger.info("Values interpolated")
 
     logger.info("Interpolating missing values in semi-major axis uncertainties")
@@ -253,9 +241,9 @@ def interp_db(df: pd.DataFrame, out_path=""):
         [
             "pl_orbsmaxerr1",
             "pl_orbsmaxerr2",
-            "flag",
+            "flag_bits",
         ]
-    ] = df.swifter.apply(interp_sma, axis=1)
+    ] = interp_sma(df)
     logger.info("Values interpolated")
 
     # Task 3: compute the parameters for the NAMD calculation
@@ -266,7 +254,7 @@ def interp_db(df: pd.DataFrame, out_path=""):
             "pl_relinclerr1",
             "pl_relinclerr2",
         ]
-    ] = df.swifter.apply(solve_relincl, args=(df,), axis=1)
+    ] = solve_relincl(df)
     logger.info("Values computed")
 
     logger.info("Interpolating missing values in true obliquity")
@@ -275,17 +263,21 @@ def interp_db(df: pd.DataFrame, out_path=""):
             "pl_trueobliq",
             "pl_trueobliqerr1",
             "pl_trueobliqerr2",
-            "flag",
+            "flag_bits",
         ]
-    ] = df.swifter.apply(interp_trueobliq, args=(df,), axis=1)
+    ] = interp_trueobliq(df)
     logger.info("Values interpolated")
 
+    logger.info("Decoding the flags")
+    df["flag"] = decode_flag_bits(df["flag_bits"])
+    logger.info("Flags decoded")
+
     # Task 4: store the curated+interpolated database
     logger.info("Storing the curated+interpolated database")
 
     if out_path == "":
         out_path = os.path.join(ROOT, "data", "exo_interp.csv")
-    df.to_csv(out_path, index=False)
+    write_db(df, out_path)
     logger.info(f"Database stored at {out_path}")
 
     return df
@@ -302,6 +294,7 @@ def calc_namd(
     use_trunc_normal=True,
     Npt=10000,
     out_path="",
+    n_jobs=1,
 ):
     """
     Compute the NAMD for a given sample of planetary systems.
@@ -318,19 +311,24 @@ def calc_namd(
         Whether to select only the "core" sample. Default is True.
     filt : callable, optional
         The filter to obtain the "core" sample. Default is None.
+    n_jobs : int, optional
+        Number of worker processes for the Monte Carlo NAMD, which is computed independently for each system. 1 runs serially, -1 uses all the available CPUs. The workers are spawned, so a script using them must guard its entry point with `if __name__ == "__main__":`. Default is 1.
 
     Notes
     -----
     The output database will have the same columns as the input database, with the addition of the NAMD parameters.
 
-    The "core" sample is defined by default as the systems with all planets having a flag of either 0, 05+, 05-, or 05+-, i.e. nothing or only the obliquity has been interpolated. Nonetheless, a custom filter can be provided via the `filt` parameter.
+    The "core" sample is defined by default as the systems with all planets having a flag of either 0, 05+, 05-, 05+5-, 05d+- or 05+-, i.e. nothing or only the obliquity has been interpolated. Nonetheless, a custom filter can be provided via the `filt` parameter.
     """
     # Task 1: reload database
     if df is None:
         logger.info("Reloading the database")
-        df = pd.read_csv(os.path.join(ROOT, "data", "exo_interp.csv"))
+        df = read_db("exo_interp")
         logger.info("Database reloaded")
 
+    logger.debug("Storing host names, planet names and flags as categoricals")
+    df = df.astype({"hostname": "category", "pl_name": "category", "flag": "category"})
+
     logger.debug("Dropping columns that are no longer needed")
     df = df.drop(columns=["pl_orbincl", "pl_orbinclerr1", "pl_orbinclerr2"])
     logger.debug("Columns dropped")
@@ -341,31 +339,14 @@ def calc_namd(
             "Invalid 'which' parameter. Must be a subset of {'rel', 'abs'}."
         )
 
-    if "rel" in which:
-        logger.info("Computing the relative NAMD")
-        df = groupby_apply_merge(
-            df,
-            "hostname",
-            solve_namd,
-            kind="rel",
-            allow_overwrite=True,
-        )
-        logger.info("Relative NAMD computed")
-
-    if "abs" in which:
-        logger.info("Computing the absolute NAMD")
-        df = groupby_apply_merge(
-            df,
-            "hostname",
-            solve_namd,
-            kind="abs",
-            allow_overwrite=True,
-        )
-        logger.info("Absolute NAMD computed")
+    logger.info(f"Computing the NAMD: {which}")
+    solved = solve_namd(df, kind=which)
+    df[solved.columns] = solved
+    logger.info("NAMD computed")
 
     if plot and (which == ["rel", "abs"]):
         (
-            df.groupby("hostname")[["namd_rel", "namd_abs"]]
+            df.groupby("hostname", observed=True)[["namd_rel", "namd_abs"]]
             .transform("mean")
             .plot(
                 kind="scatter",
@@ -378,7 +359,7 @@ def calc_namd(
 
     if plot and ("rel" in which):
         (
-            df.groupby("hostname")[["sy_pnum", "namd_rel"]]
+            df.groupby("hostname", observed=True)[["sy_pnum", "namd_rel"]]
             .mean()
             .reset_index()
             .plot(
@@ -392,7 +373,7 @@ def calc_namd(
 
     if plot and ("abs" in which):
         (
-            df.groupby("hostname")[["sy_pnum", "namd_abs"]]
+            df.groupby("hostname", observed=True)[["sy_pnum", "namd_abs"]]
             .mean()
             .reset_index()
             .plot(
@@ -406,16 +387,26 @@ def calc_namd(
 
     if core and (filt is None):
         logger.info("Defining the core sample")
-        core_flags = ["0", "05+", "05-", "05+-", "05d+-"]
-        df = df.groupby("hostname").filter(lambda x: all(x["flag"].isin(core_flags)))
+        if "flag_bits" in df.columns:
+            # Any bit other than the true obliquity ones marks an interpolated value
+            obliq_bits = (
+                FLAG_BITS["5+"] | FLAG_BITS["5-"] | FLAG_BITS["5d+-"] | FLAG_BITS["5+-"]
+            )
+            flag_bits = df["flag_bits"].to_numpy(dtype=np.uint32)
+            is_core = pd.Series((flag_bits & ~obliq_bits) == 0, index=df.index)
+        else:
+            # Databases stored before the flag bits were kept only have the flags
+            core_flags = ["0", "05+", "05-", "05+5-", "05d+-", "05+-"]
+            is_core = df["flag"].isin(core_flags)
+        df = df[is_core.groupby(df["hostname"], observed=True).transform("all")]
         logger.info("Core sample defined")
     elif core and (filt is not None):
         logger.info("Defining the core sample using the custom filter")
-        df = df.groupby("hostname").filter(filt)
+        df = df.groupby("hostname", observed=True).filter(filt)
 
     if plot and ("rel" in which) and core:
         (
-            df.groupby("hostname")[["sy_pnum", "namd_rel"]]
+            df.groupby("hostname", observed=True)[["sy_pnum", "namd_rel"]]
             .transform("mean")
             .plot(
                 kind="scatter",
@@ -428,7 +419,7 @@ def calc_namd(
 
     if plot and ("abs" in which) and core:
         (
-            df.groupby("hostname")[["sy_pnum", "namd_abs"]]
+            df.groupby("hostname", observed=True)[["sy_pnum", "namd_abs"]]
             .transform("mean")
             .plot(
                 kind="scatter",
@@ -440,37 +431,23 @@ def calc_namd(
         )
 
     # Task 3: compute the NAMD and associated confidence intervals
-    if "rel" in which:
-        logger.info("Computing the Monte Carlo relative NAMD")
-        df = groupby_apply_merge(
-            df,
-            "hostname",
-            solve_namd_mc,
-            kind="rel",
-            Npt=Npt,
-            threshold=threshold,
-            use_trunc_normal=use_trunc_normal,
-            allow_overwrite=True,
-        )
-        logger.info("Relative NAMD computed")
-
-    if "abs" in which:
-        logger.info("Computing the Monte Carlo absolute NAMD")
-        df = groupby_apply_merge(
-            df,
-            "hostname",
-            solve_namd_mc,
-            kind="abs",
-            Npt=Npt,
-            threshold=threshold,
-            use_trunc_normal=use_trunc_normal,
-            allow_overwrite=True,
-        )
-        logger.info("Absolute NAMD computed")
+    logger.info(f"Computing the Monte Carlo NAMD: {which}")
+    df = groupby_apply_merge(
+        df,
+        "hostname",
+        solve_namd_mc,
+        kind=which,
+        Npt=Npt,
+        threshold=threshold,
+        use_trunc_normal=use_trunc_normal,
+        allow_overwrite=True,
+        n_jobs=n_jobs,
+    )
+    logger.info("Monte Carlo NAMD computed")
 
     if plot and (which == ["rel", "abs"]):
         (
-            df.groupby("hostname")[["namd_rel_q50", "namd_abs_q50"]]
+            df.groupby("hostname", observed=True)[["namd_rel_q50", "namd_abs_q50"]]
             .transform("mean")
             .plot(kind="scatter", x="namd_rel_q50", y="namd_abs_q50", loglog=True)
         )
@@ -480,7 +457,7 @@ def calc_namd(
         logger.info("Storing the NAMD database")
         if out_path == "":
             out_path = os.path.join(ROOT, "data", "exo_namd.csv")
-        df.to_csv(out_path, index=False)
+        write_db(df, out_path)
         logger.info(f"Database stored at {out_path}")
 
     return df
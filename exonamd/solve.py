@@ -4,218 +4,260 @@ import astropy.units as u
 import pandas as pd
 from loguru import logger
 
-from exonamd.utils import get_value
 from exonamd.utils import sample_trunc_normal
 from exonamd.core import compute_amdk
 from exonamd.core import compute_namd
+from exonamd.core import compute_namd_mc
+from exonamd.core import sample_namd_rejection
 
 
 # Functions solve_a_rs, solve_rprs, solve_a_period, solve_values
 # below are originally from gen_tso
 # by Patricio Cubillos: https://github.com/pcubillos/gen_tso
 # modified to work in this project
+#
+# The systems of equations take the missing-value masks of their inputs
+# through the optional isnan argument, so that solve_values computes them
+# only once. The masks are updated in place: the entries of the values that
+# are filled in are set to False, so that the masks can be passed on to the
+# next system of equations.
+
+# Unit conversion factors of the equations below
+_RSUN_IN_AU = (1.0 * u.R_sun).to(u.au).value
+_RSUN_IN_REARTH = (1.0 * u.R_sun).to(u.R_earth).value
+# Period (days) of an orbit with sma = 1 AU around a star with mstar = 1 M_sun
+_KEPLER_K = (2.0 * np.pi / np.sqrt(cc.G) * u.au**1.5 / u.M_sun**0.5).to(u.day).value
+# Angle entering the AMD for each kind of NAMD
+_DI_COLS = {"rel": "pl_relincl", "abs": "pl_trueobliq"}
+
+
+def _unwrap(*values):
+    """
+    Returns the solved values, as Python floats for scalar inputs.
+    """
+    return tuple(v.item() if v.ndim == 0 else v for v in values)
 
 
-def solve_a_rs(sma, rstar, ars):
+def solve_a_rs(sma, rstar, ars, isnan=None):
     """
     Solve semi-major axis -- stellar radius system of equations.
 
     Parameters
     ----------
-    sma: Float
+    sma: Float or ndarray
         Orbital semi-major axis (AU).
-    rstar: Float
+    rstar: Float or ndarray
         Stellar radius (r_sun).
-    ars: Float
+    ars: Float or ndarray
         sma--rstar ratio.
+    isnan: tuple of ndarray, optional
+        Missing-value masks of sma, rstar and ars, updated in place.
     """
-    missing = np.isnan(sma) + np.isnan(rstar) + np.isnan(ars)
-    # Know everything or not enough:
-    if missing != 1:
-        return sma, rstar, ars
+    sma, rstar, ars = (np.asarray(x, dtype=float) for x in (sma, rstar, ars))
+    if isnan is None:
+        isnan = np.isnan(sma), np.isnan(rstar), np.isnan(ars)
+    nan_sma, nan_rstar, nan_ars = isnan
+    # Solve only where exactly one value is missing:
+    solve = nan_sma.astype(int) + nan_rstar + nan_ars == 1
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sma = np.where(solve & nan_sma, ars * rstar * _RSUN_IN_AU, sma)
+        rstar = np.where(solve & nan_rstar, sma / ars / _RSUN_IN_AU, rstar)
+        ars = np.where(solve & nan_ars, sma / (rstar * _RSUN_IN_AU), ars)
 
-    if np.isnan(sma):
-        sma = ars * rstar * u.R_sun
-        sma = sma.to(u.au).value
-    elif np.isnan(rstar):
-        rstar = sma * u.au / ars
-        rstar = rstar.to(u.R_sun).value
-    elif np.isnan(ars):
-        ars = sma * u.au / (rstar * u.R_sun).to(u.au)
-        ars = ars.value
+    for mask in isnan:
+        mask &= ~solve
 
-    return sma, rstar, ars
+    return _unwrap(sma, rstar, ars)
 
 
-def solve_rprs(rplanet, rstar, rprs):
+def solve_rprs(rplanet, rstar, rprs, isnan=None):
     """
     Solve planet radius -- stellar radius system of equations.
 
     Parameters
     ----------
-    rplanet: Float
+    rplanet: Float or ndarray
         Planet radius (r_earth).
-    rstar: Float
+    rstar: Float or ndarray
         Stellar radius (r_sun).
-    rprs: Float
+    rprs: Float or ndarray
         Planet--star radius ratio.
+    isnan: tuple of ndarray, optional
+        Missing-value masks of rplanet, rstar and rprs, updated in place.
     """
-    missing = np.isnan(rplanet) + np.isnan(rstar) + np.isnan(rprs)
-    # Know everything or not enough:
-    if missing != 1:
-        return rplanet, rstar, rprs
+    rplanet, rstar, rprs = (np.asarray(x, dtype=float) for x in (rplanet, rstar, rprs))
+    if isnan is None:
+        isnan = np.isnan(rplanet), np.isnan(rstar), np.isnan(rprs)
+    nan_rplanet, nan_rstar, nan_rprs = isnan
+    # Solve only where exactly one value is missing:
+    solve = nan_rplanet.astype(int) + nan_rstar + nan_rprs == 1
 
-    if np.isnan(rplanet):
-        rplanet = rprs * (rstar * u.R_sun)
-        rplanet = rplanet.to(u.R_earth).value
-    elif np.isnan(rstar):
-        rstar = rplanet * u.R_earth / rprs
-        rstar = rstar.to(u.R_sun).value
-    elif np.isnan(rprs):
-        rprs = rplanet * u.R_earth / (rstar * u.R_sun).to(u.R_earth)
-        rprs = rprs.value
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rplanet = np.where(solve & nan_rplanet, rprs * rstar * _RSUN_IN_REARTH, rplanet)
+        rstar = np.where(solve & nan_rstar, rplanet / rprs / _RSUN_IN_REARTH, rstar)
+        rprs = np.where(solve & nan_rprs, rplanet / (rstar * _RSUN_IN_REARTH), rprs)
 
-    return rplanet, rstar, rprs
+    for mask in isnan:
+        mask &= ~solve
 
+    return _unwrap(rplanet, rstar, rprs)
 
-def solve_a_period(period, sma, mstar):
+
+def solve_a_period(period, sma, mstar, isnan=None):
     """
     Solve period-sma-mstar system of equations.
 
     Parameters
     ----------
-    period: Float
+    period: Float or ndarray
         Orbital period (days).
-    sma: Float
+    sma: Float or ndarray
         Orbital semi-major axis (AU).
-    mstar: Float
+    mstar: Float or ndarray
         Stellar mass (m_sun).
+    isnan: tuple of ndarray, optional
+        Missing-value masks of period, sma and mstar, updated in place.
     """
-    missing = np.isnan(period) + np.isnan(sma) + np.isnan(mstar)
-    # Know everything or not enough:
-    if missing != 1:
-        return period, sma, mstar
+    period, sma, mstar = (np.asarray(x, dtype=float) for x in (period, sma, mstar))
+    if isnan is None:
+        isnan = np.isnan(period), np.isnan(sma), np.isnan(mstar)
+    nan_period, nan_sma, nan_mstar = isnan
+    # Solve only where exactly one value is missing:
+    solve = nan_period.astype(int) + nan_sma + nan_mstar == 1
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mstar = np.where(
+            solve & nan_mstar, sma**3.0 / (period / _KEPLER_K) ** 2.0, mstar
+        )
+        period = np.where(
+            solve & nan_period, np.sqrt(sma**3.0 / mstar) * _KEPLER_K, period
+        )
+        sma = np.where(
+            solve & nan_sma, ((period / _KEPLER_K) ** 2.0 * mstar) ** (1 / 3), sma
+        )
 
-    two_pi_G = 2.0 * np.pi / np.sqrt(cc.G)
-    if np.isnan(mstar):
-        mstar = (sma * u.au) ** 3.0 / (period * u.day / two_pi_G) ** 2.0
-        mstar = mstar.to(u.M_sun).value
-    elif np.isnan(period):
-        period = np.sqrt((sma * u.au) ** 3.0 / (mstar * u.M_sun)) * two_pi_G
-        period = period.to(u.day).value
-    elif np.isnan(sma):
-        sma = ((period * u.day / two_pi_G) ** 2.0 * (mstar * u.M_sun)) ** (1 / 3)
-        sma = sma.to(u.au).value
+    for mask in isnan:
+        mask &= ~solve
 
-    return period, sma, mstar
+    return _unwrap(period, sma, mstar)
 
 
 @logger.catch
-def solve_values(row):
-    sma = get_value(row["pl_orbsmax"])
-    ars = get_value(row["pl_ratdor"])
-    rstar = get_value(row["st_rad"])
-    rplanet = get_value(row["pl_rade"])
-    rprs = get_value(row["pl_ratror"])
-    period = get_value(row["pl_orbper"])
-    mstar = get_value(row["st_mass"])
-
-    # Rank groups
-    a_rs_ = np.isnan(sma) + np.isnan(ars) + np.isnan(rstar)
-    rprs_ = np.isnan(rplanet) + np.isnan(rprs) + np.isnan(rstar)
-    a_period_ = np.isnan(period) + np.isnan(sma) + np.isnan(mstar)
-    solve_order = np.argsort([a_rs_, rprs_, a_period_])
-    for i in solve_order:
-        if i == 0:
-            logger.trace(
-                "Solving semi-major axis -- stellar radius system of equations."
-            )
-            solution = solve_a_rs(sma, rstar, ars)
-            sma, rstar, ars = solution
-        elif i == 1:
-            logger.trace("Solving planet radius -- stellar radius system of equations.")
-            solution = solve_rprs(rplanet, rstar, rprs)
-            rplanet, rstar, rprs = solution
-        elif i == 2:
-            logger.trace("Solving period-sma-mstar system of equations.")
-            solution = solve_a_period(period, sma, mstar)
-            period, sma, mstar = solution
+def solve_values(df):
+    """
+    Fill in the missing semi-major axes, stellar and planetary radii, periods and stellar masses from the simple relations between them.
 
-    out = {
-        "pl_orbsmax": sma,
-        "pl_ratdor": ars,
-        "st_rad": rstar,
-        "pl_rade": rplanet,
-        "pl_ratror": rprs,
-        "pl_orbper": period,
-        "st_mass": mstar,
-    }
+    The systems of equations are solved at once for all the rows with missing values. Solving a system only fills in missing values, so they can be solved in a fixed order.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        The planet table.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A pandas DataFrame containing the solved values.
+    """
+    cols = [
+        "pl_orbsmax",
+        "pl_ratdor",
+        "st_rad",
+        "pl_rade",
+        "pl_ratror",
+        "pl_orbper",
+        "st_mass",
+    ]
+    values = df[cols].to_numpy(dtype=float, copy=True)
+    isnan = np.isnan(values)
+
+    # Rows with nothing missing have nothing to solve
+    todo = isnan.any(axis=1)
+    if not todo.any():
+        return pd.DataFrame(values, index=df.index, columns=cols)
+
+    sma, ars, rstar, rplanet, rprs, period, mstar = values[todo].T
+    # Missing-value masks, computed once and kept up to date by the solvers
+    nan_sma, nan_ars, nan_rstar, nan_rplanet, nan_rprs, nan_period, nan_mstar = (
+        isnan[todo].T
+    )
+
+    logger.trace("Solving semi-major axis -- stellar radius system of equations.")
+    sma, rstar, ars = solve_a_rs(sma, rstar, ars, isnan=(nan_sma, nan_rstar, nan_ars))
+    logger.trace("Solving planet radius -- stellar radius system of equations.")
+    rplanet, rstar, rprs = solve_rprs(
+        rplanet, rstar, rprs, isnan=(nan_rplanet, nan_rstar, nan_rprs)
+    )
+    logger.trace("Solving period-sma-mstar system of equations.")
+    period, sma, mstar = solve_a_period(
+        period, sma, mstar, isnan=(nan_period, nan_sma, nan_mstar)
+    )
+
+    values[todo] = np.column_stack([sma, ars, rstar, rplanet, rprs, period, mstar])
 
-    return pd.Series(out)
+    return pd.DataFrame(values, index=df.index, columns=cols)
 
 
 @logger.catch
-def solve_relincl(row, df):
+def solve_relincl(df):
     """
-    Computes the relative inclination of a planet with respect to the most massive planet in the same system.
+    Computes the relative inclination of the planets with respect to the most massive planet in the same system.
+
+    The computation is vectorized over the whole table: the most massive planet of each system is found once, and then broadcast to its planets.
 
     Parameters
     ----------
-    row: pandas.Series
-        A row from the planet table.
     df: pandas.DataFrame
         The planet table.
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the relative inclination and the associated uncertainties.
+    pandas.DataFrame
+        A pandas DataFrame containing the relative inclination and the associated uncertainties.
     """
-    hostname = get_value(row["hostname"])
-    incl = get_value(row["pl_orbincl"])
-    inclerr1 = get_value(row["pl_orbinclerr1"])
-    inclerr2 = get_value(row["pl_orbinclerr2"])
+    cols = ["pl_orbincl", "pl_orbinclerr1", "pl_orbinclerr2"]
+    incl, inclerr1, inclerr2 = df[cols].to_numpy(dtype=float).T
 
-    host = df[df["hostname"] == hostname]
-    max_mass = host["pl_bmasse"].idxmax()
-    max_mass = host.loc[max_mass, ["pl_orbincl", "pl_orbinclerr1", "pl_orbinclerr2"]]
-
-    relincl = max_mass["pl_orbincl"] - incl
-    relinclerr1 = np.sqrt(inclerr1**2 + max_mass["pl_orbinclerr1"] ** 2)
-    relinclerr2 = -np.sqrt(inclerr2**2 + max_mass["pl_orbinclerr2"] ** 2)
+    # Position of the most massive planet of the system of each planet
+    hosts = df.groupby("hostname", sort=False, observed=True)
+    max_mass_pos = df.index.get_indexer(hosts["pl_bmasse"].transform("idxmax"))
+    max_incl = incl[max_mass_pos]
+    max_inclerr1 = inclerr1[max_mass_pos]
+    max_inclerr2 = inclerr2[max_mass_pos]
 
     out = {
-        "pl_relincl": relincl,
-        "pl_relinclerr1": relinclerr1,
-        "pl_relinclerr2": relinclerr2,
+        "pl_relincl": max_incl - incl,
+        "pl_relinclerr1": np.sqrt(inclerr1**2 + max_inclerr1**2),
+        "pl_relinclerr2": -np.sqrt(inclerr2**2 + max_inclerr2**2),
     }
 
-    return pd.Series(out)
+    return pd.DataFrame(out, index=df.index)
 
 
-def solve_amdk(row, kind: str):
+def solve_amdk(df, kind: str):
     """
-    Wrapper of the function **compute_amdk** to compute the angular momentum deficit (AMD) for a planet (or planets) in a system.
+    Wrapper of the function **compute_amdk** to compute the angular momentum deficit (AMD) of every planet in the planet table.
 
     Parameters
     ----------
-    row: pandas.Series
-        A row from the planet table.
+    df: pandas.DataFrame
+        The planet table.
     kind: str
         Which type of AMD to compute. One of 'rel' (relative, using the relative inclination) or 'abs' (absolute, using the obliquity).
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the angular momentum deficit and the associated mass and sqrt of the semi-major axis.
+    pandas.DataFrame
+        A pandas DataFrame containing the angular momentum deficit and the associated mass and sqrt of the semi-major axis.
     """
-    mass = get_value(row["pl_bmasse"])
-    eccen = get_value(row["pl_orbeccen"])
-    di_ = {"rel": get_value(row["pl_relincl"]), "abs": get_value(row["pl_trueobliq"])}
-    di = di_[kind]
-    sma = get_value(row["pl_orbsmax"])
+    mass = df["pl_bmasse"].to_numpy(dtype=float)
+    eccen = df["pl_orbeccen"].to_numpy(dtype=float)
+    di = df[_DI_COLS[kind]].to_numpy(dtype=float)
+    sma = df["pl_orbsmax"].to_numpy(dtype=float)
 
-    amdk = compute_amdk(mass, eccen, di, sma)
+    sqrt_sma = np.sqrt(sma)
+    amdk = compute_amdk(mass, eccen, di, sma, sqrt_a=sqrt_sma)
 
     if kind == "abs":
         amdk /= 2.0  # divided by 2 to ensure the normalization of the absolute NAMD is between 0 and 1
@@ -223,221 +265,223 @@ def solve_amdk(row, kind: str):
     out = {
         f"amdk_{kind}": amdk,
         "mass": mass,
-        "sqrt_sma": np.sqrt(sma),
+        "sqrt_sma": sqrt_sma,
     }
 
-    return pd.Series(out)
+    return pd.DataFrame(out, index=df.index)
 
 
 @logger.catch
-def solve_namd(host, kind: str):
+def solve_namd(df, kind: str):
     """
-    Wrapper of the functions **solve_amdk** and **compute_namd** to compute the normalized angular momentum deficit (NAMD) for a given system.
+    Compute the normalized angular momentum deficit (NAMD) of every system in the planet table.
+
+    The AMD of each planet is computed with **solve_amdk** on the whole table. The planets are then laid out in arrays of shape (n_pl, n_systems), padded with massless planets, so that **compute_namd** reduces all the systems at once.
 
     Parameters
     ----------
-    host: pandas.DataFrame
-        A DataFrame containing the planet table.
-    kind: str
-        Which type of NAMD to compute. One of 'rel' (relative, using the relative inclination) or 'abs' (absolute, using the obliquity).
+    df: pandas.DataFrame
+        The planet table.
+    kind: str or list of str
+        Which type of NAMD to compute. One of 'rel' (relative, using the relative inclination) or 'abs' (absolute, using the obliquity), or a list of them to compute several in the same pass.
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the normalized angular momentum deficit.
+    pandas.DataFrame
+        A pandas DataFrame containing the normalized angular momentum deficit of the system of each planet.
     """
-    retval = host.apply(solve_amdk, args=(kind,), axis=1)
+    kinds = [kind] if isinstance(kind, str) else kind
+
+    # System of each planet, and position of the planet within its system
+    system, _ = pd.factorize(df["hostname"])
+    position = df.groupby(system, sort=False).cumcount().to_numpy()
+    shape = (position.max() + 1, system.max() + 1) if len(df) else (0, 0)
+
+    def _layout(values):
+        # The padding planets have zero mass, hence zero AMD and zero weight
+        out = np.zeros(shape)
+        out[position, system] = values
+        return out
+
+    out = {}
+    for kind in kinds:
+        amdk = solve_amdk(df, kind)
+        namd = compute_namd(
+            _layout(amdk[f"amdk_{kind}"]),
+            _layout(amdk["mass"]),
+            _layout(amdk["sqrt_sma"]),
+        )
+        out[f"namd_{kind}"] = namd[system]
 
-    amdk = retval[f"amdk_{kind}"]
-    mass = retval["mass"]
-    sqrt_sma = retval["sqrt_sma"]
+    return pd.DataFrame(out, index=df.index)
 
-    namd = compute_namd(amdk, mass, sqrt_sma)
 
-    out = {f"namd_{kind}": namd}
-    return pd.Series(out)
+def _loc_scale(host, col):
+    """
+    Returns the values of a column and their symmetrized uncertainties as column vectors, ready to be broadcast against the Monte Carlo samples.
+    """
+    loc = host[col].to_numpy(dtype=float)
+    scale = 0.5 * (
+        host[f"{col}err1"].to_numpy(dtype=float)
+        - host[f"{col}err2"].to_numpy(dtype=float)
+    )
+    return loc[:, None], scale[:, None]
 
 
-def solve_amdk_mc(row, kind, Npt, threshold, use_trunc_normal=True):
+def _sample_mc(host, kind, Npt, seed=None):
+    """
+    Draw the Monte Carlo samples of the mass, eccentricity, relative angle and semi-major axis of the planets in a system from truncated normal distributions, as arrays of shape (n_pl, Npt).
     """
-    Compute the absolute or relative angular momentum deficit (AMD) for a given planet using a Monte Carlo approach.
+    di_col = _DI_COLS[kind]
+    di_upper = 180.0 if kind == "abs" else 90.0
+
+    mass, mass_sigma = _loc_scale(host, "pl_bmasse")
+    eccen, eccen_sigma = _loc_scale(host, "pl_orbeccen")
+    di, di_sigma = _loc_scale(host, di_col)
+    sma, sma_sigma = _loc_scale(host, "pl_orbsmax")
+
+    if kind == "rel":
+        di = np.abs(di)  # sign is not important as this is the argument of the cosine
+
+    shape = (len(host), Npt)
+    rng = np.random.default_rng(seed)
+
+    # Sample the parameters
+    mass = sample_trunc_normal(
+        mu=mass,
+        sigma=mass_sigma,
+        lower=0.0,
+        upper=np.inf,
+        n=shape,
+        random_state=rng,
+    )
+    eccen = sample_trunc_normal(
+        mu=eccen,
+        sigma=eccen_sigma,
+        lower=0.0,
+        upper=1.0,
+        n=shape,
+        random_state=rng,
+    )
+    di = sample_trunc_normal(
+        mu=di,
+        sigma=di_sigma,
+        lower=0.0,
+        upper=di_upper,
+        n=shape,
+        random_state=rng,
+    )
+    sma = sample_trunc_normal(
+        mu=sma,
+        sigma=sma_sigma,
+        lower=0.0,
+        upper=np.inf,
+        n=shape,
+        random_state=rng,
+    )
+
+    return mass, eccen, di, sma
+
+
+def solve_namd_samples(host, kind, Npt, use_trunc_normal=True, seed=None):
+    """
+    Sample the normalized angular momentum deficit (NAMD) for a given system using a Monte Carlo approach.
 
     Parameters
     ----------
-    row: pandas.Series
-        A row from the planet table.
+    host: pandas.DataFrame
+        A DataFrame containing the system table.
     kind: str
-        Which type of AMD to compute. One of 'rel' (relative, using the relative inclination) or 'abs' (absolute, using the obliquity).
+        Which type of NAMD to compute. One of 'rel' (relative, using the relative inclination) or 'abs' (absolute, using the obliquity).
     Npt: int
         Number of Monte Carlo samples.
-    threshold: int
-        Minimum number of valid samples required.
     use_trunc_normal: bool
         If True, use a truncated normal distribution to sample the parameters. If False, use a normal distribution with rejection sampling.
+    seed: int, np.random.Generator or None
+        Seed (or generator) for the random number generator.
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the absolute or relative AMD, the associated mass and sqrt of the semi-major axis.
+    namd: np.ndarray
+        The NAMD samples. With rejection sampling, only the physical samples are returned, so there can be fewer than Npt.
     """
-    mass = get_value(row["pl_bmasse"])
-    masserr1 = get_value(row["pl_bmasseerr1"])
-    masserr2 = get_value(row["pl_bmasseerr2"])
-    eccen = get_value(row["pl_orbeccen"])
-    eccenerr1 = get_value(row["pl_orbeccenerr1"])
-    eccenerr2 = get_value(row["pl_orbeccenerr2"])
-
-    di_ = {
-        "rel": np.abs(
-            get_value(row["pl_relincl"])
-        ),  # sign is not important as this is the argument of the cosine
-        "relerr1": get_value(row["pl_relinclerr1"]),
-        "relerr2": get_value(row["pl_relinclerr2"]),
-        "abs": get_value(row["pl_trueobliq"]),
-        "abserr1": get_value(row["pl_trueobliqerr1"]),
-        "abserr2": get_value(row["pl_trueobliqerr2"]),
-    }
-
-    di = di_[kind]
-    dierr1 = di_[f"{kind}err1"]
-    dierr2 = di_[f"{kind}err2"]
-    di_upper = 180.0 if kind == "abs" else 90.0
-
-    sma = get_value(row["pl_orbsmax"])
-    smaerr1 = get_value(row["pl_orbsmaxerr1"])
-    smaerr2 = get_value(row["pl_orbsmaxerr2"])
-
-    # Sample the parameters
     if use_trunc_normal:
-        mass_mc = sample_trunc_normal(
-            mu=mass,
-            sigma=0.5 * (masserr1 - masserr2),
-            lower=0.0,
-            upper=np.inf,
-            n=Npt,
-        )
-        eccen_mc = sample_trunc_normal(
-            mu=eccen,
-            sigma=0.5 * (eccenerr1 - eccenerr2),
-            lower=0.0,
-            upper=1.0,
-            n=Npt,
-        )
-        di_mc = sample_trunc_normal(
-            mu=di,
-            sigma=0.5 * (dierr1 - dierr2),
-            lower=0.0,
-            upper=di_upper,
-            n=Npt,
+        mass, eccen, di, sma = _sample_mc(host, kind, Npt, seed=seed)
+        return compute_namd_mc(
+            mass, eccen, di, sma, amdk_factor=0.5 if kind == "abs" else 1.0
         )
-        sma_mc = sample_trunc_normal(
-            mu=sma,
-            sigma=0.5 * (smaerr1 - smaerr2),
-            lower=0.0,
-            upper=np.inf,
-            n=Npt,
-        )
-
-    else:
-        mass_mc = np.random.normal(mass, 0.5 * (masserr1 - masserr2), Npt)
-        eccen_mc = np.random.normal(eccen, 0.5 * (eccenerr1 - eccenerr2), Npt)
-        di_mc = np.random.normal(di, 0.5 * (dierr1 - dierr2), Npt)
-        sma_mc = np.random.normal(sma, 0.5 * (smaerr1 - smaerr2), Npt)
-
-        # Mask unphysical values
-        mask = (
-            (mass_mc > 0)
-            & (eccen_mc >= 0)
-            & (eccen_mc < 1)
-            & (di_mc >= 0.0)
-            & (di_mc < di_upper)
-            & (sma_mc > 0)
-        )
-
-        # Check number of valid samples
-        if np.sum(mask) < threshold:
-            out = {
-                f"amdk_{kind}_mc": np.nan,
-                "mass_mc": np.nan,
-                "sqrt_sma_mc": np.nan,
-            }
-
-            return pd.Series(out)
-
-        mass_mc = np.ma.MaskedArray(mass_mc, mask=~mask)
-        eccen_mc = np.ma.MaskedArray(eccen_mc, mask=~mask)
-        di_mc = np.ma.MaskedArray(di_mc, mask=~mask)
-        sma_mc = np.ma.MaskedArray(sma_mc, mask=~mask)
 
-    # Compute the amdk
-    amdk = compute_amdk(mass_mc, eccen_mc, di_mc, sma_mc)
-    
-    if kind == "abs":
-        amdk /= 2.0  # divided by 2 to ensure the normalization of the absolute NAMD is between 0 and 1
-
-    out = {
-        f"amdk_{kind}_mc": amdk,
-        "mass_mc": mass_mc,
-        "sqrt_sma_mc": np.sqrt(sma_mc),
-    }
-
-    return pd.Series(out)
+    # Draw, reject and reduce the samples in a single compiled pass
+    di_col = _DI_COLS[kind]
+    loc, scale = zip(
+        *[
+            _loc_scale(host, col)
+            for col in ["pl_bmasse", "pl_orbeccen", di_col, "pl_orbsmax"]
+        ]
+    )
+    loc = np.hstack(loc).T.copy()
+    scale = np.hstack(scale).T.copy()
+    if kind == "rel":
+        loc[2] = np.abs(loc[2])  # sign is not important as this is the argument of the cosine
+
+    return sample_namd_rejection(
+        loc,
+        scale,
+        di_upper=180.0 if kind == "abs" else 90.0,
+        Npt=Npt,
+        amdk_factor=0.5 if kind == "abs" else 1.0,
+        seed=seed,
+    )
 
 
 @logger.catch
-def solve_namd_mc(host, kind, Npt, threshold, use_trunc_normal, full=False):
+def solve_namd_mc(
+    host, kind, Npt, threshold, use_trunc_normal, full=False, seed=None
+):
     """
-    Wrapper of the functions **solve_amdk_mc** and **compute_namd** to compute the normalized angular momentum deficit (NAMD) for a given system using a Monte Carlo approach.
+    Wrapper of the function **solve_namd_samples** to compute the normalized angular momentum deficit (NAMD) for a given system using a Monte Carlo approach.
 
     Parameters
     ----------
     host: pandas.DataFrame
         A DataFrame containing the system table.
-    kind: str
-        Which type of NAMD to compute. One of 'rel' (relative, using the relative inclination) or 'abs' (absolute, using the obliquity).
+    kind: str or list of str
+        Which type of NAMD to compute. One of 'rel' (relative, using the relative inclination) or 'abs' (absolute, using the obliquity), or a list of them to compute several in the same pass.
     Npt: int
         Number of Monte Carlo samples.
     threshold: int
-        Minimum number of valid samples required.
+        Minimum number of valid samples required. With rejection sampling, a sample is valid only if it is physical for all the planets in the system, so the results are nan if any planet has fewer than `threshold` physical samples, and can be nan even if each planet has more.
     use_trunc_normal: bool
         If True, use a truncated normal distribution to sample the parameters. If False, use a normal distribution with rejection sampling.
     full: bool
         If True, return the full array of NAMD values. Otherwise, return only the 16th, 50th and 84th percentiles.
+    seed: int, np.random.Generator or None
+        Seed (or generator) for the random number generator.
 
     Returns
     -------
-    pandas.Series
-        A pandas Series containing the normalized angular momentum deficit results.
+    dict
+        A dictionary containing the normalized angular momentum deficit results, keyed by column name.
     """
-    retval = host.apply(
-        solve_amdk_mc, args=(kind, Npt, threshold, use_trunc_normal), axis=1
-    )
-
-    amdk = retval[f"amdk_{kind}_mc"]
-    mass = retval["mass_mc"]
-    sqrt_sma = retval["sqrt_sma_mc"]
-
-    namd = compute_namd(amdk, mass, sqrt_sma)
-    if isinstance(namd, np.ma.MaskedArray):
-        namd = namd.compressed()
+    kinds = [kind] if isinstance(kind, str) else kind
+    rng = np.random.default_rng(seed)
 
-    if len(namd) < threshold:
-        out = {
-            f"namd_{kind}_mc": np.nan,
-            f"namd_{kind}_q16": np.nan,
-            f"namd_{kind}_q50": np.nan,
-            f"namd_{kind}_q84": np.nan,
-        }
+    out = {}
+    for kind in kinds:
+        namd = solve_namd_samples(host, kind, Npt, use_trunc_normal, seed=rng)
 
-        return pd.Series(out)
+        if len(namd) < threshold:
+            out[f"namd_{kind}_mc"] = np.nan
+            out[f"namd_{kind}_q16"] = np.nan
+            out[f"namd_{kind}_q50"] = np.nan
+            out[f"namd_{kind}_q84"] = np.nan
+            continue
 
-    namd_p = np.percentile(namd, [16, 50, 84])
+        q16, q50, q84 = np.quantile(namd, [0.16, 0.5, 0.84])
 
-    out = {
-        f"namd_{kind}_mc": namd if full else np.nan,
-        f"namd_{kind}_q16": namd_p[0],
-        f"namd_{kind}_q50": namd_p[1],
-        f"namd_{kind}_q84": namd_p[2],
-    }
+        out[f"namd_{kind}_mc"] = namd if full else np.nan
+        out[f"namd_{kind}_q16"] = q16
+        out[f"namd_{kind}_q50"] = q50
+        out[f"namd_{kind}_q84"] = q84
 
-    return pd.Series(out)
+    return out
@@ -1,12 +1,15 @@
 import os
 import urllib
 import concurrent.futures
+import functools
+import multiprocessing
 import re
 import pickle
 import numpy as np
 import pandas as pd
 import requests
 import warnings
+import numba
 from astroquery.simbad import Simbad as simbad
 from loguru import logger
 
@@ -412,35 +415,91 @@ def fetch_aliases(hosts, output_file=None, known_aliases=None):
 
 
 @logger.catch
-def update_host(row, aliases):
-    host = get_value(row["hostname"])
+def host_alias_map(aliases):
+    """
+    Build the lookup table from each host alias to its reference host name.
+
+    Parameters
+    ----------
+    aliases : dict
+        Dictionary of aliases, as returned by `fetch_aliases`.
+
+    Returns
+    -------
+    dict
+        Mapping from host alias to host name. When an alias belongs to more than one system, the first system wins.
+    """
+    host_map = {}
     for key, item in aliases.items():
-        if host in item["host_aliases"]:
-            if host != key:
-                logger.debug(f"Updating host {host} to {key}")
-            return key
-    return host
+        for alias in item["host_aliases"]:
+            host_map.setdefault(alias, key)
+    return host_map
 
 
 @logger.catch
-def update_planet(row, aliases):
-    planet = get_value(row["pl_name"])
+def planet_alias_map(aliases):
+    """
+    Build the lookup table from each planet alias to its updated planet name.
+
+    Parameters
+    ----------
+    aliases : dict
+        Dictionary of aliases, as returned by `fetch_aliases`.
+
+    Returns
+    -------
+    dict
+        Mapping from planet alias to planet name. Aliases that are already up to date are not included.
+    """
+    planet_map = {}
     for key, item in aliases.items():
-        planet_aliases = item["planet_aliases"]
-        if planet in planet_aliases.keys():
-            name = planet_aliases[planet]
+        for planet, name in item["planet_aliases"].items():
+            if planet in planet_map:
+                continue
             if name[: len(key)] != key:
-                logger.debug(f"Updating planet {planet} to {key + name[-2:]}")
-                return key + name[-2:]
+                planet_map[planet] = key + name[-2:]
             elif planet != name:
-                logger.debug(f"Updating planet {planet} to {name}")
-                return name
-    return planet
+                planet_map[planet] = name
+    return planet_map
+
+
+def _apply_group(group, func, args, kwargs):
+    return func(group, *args, **kwargs)
+
+
+def _init_worker():
+    # The groups are already spread over the workers, so each worker runs the
+    # compiled kernels on a single thread instead of one per core
+    numba.set_num_threads(1)
 
 
 @logger.catch
-def groupby_apply_merge(df, groupby, func, *args, allow_overwrite=False, **kwargs):
-    retval = df.groupby(groupby).apply(func, *args, **kwargs)
+def groupby_apply_merge(
+    df, groupby, func, *args, allow_overwrite=False, n_jobs=1, **kwargs
+):
+    # Slice the groups once, so that each worker only receives its own group
+    groups = dict(list(df.groupby(groupby, sort=False, observed=True)))
+
+    if n_jobs == 1:
+        rows = [func(group, *args, **kwargs) for group in groups.values()]
+    else:
+        task = functools.partial(_apply_group, func=func, args=args, kwargs=kwargs)
+        max_workers = None if n_jobs == -1 else n_jobs
+        # Spawn the workers: forking a process whose numba thread pool is
+        # already running can leave the interpreter hanging at exit
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        ) as executor:
+            rows = list(executor.map(task, groups.values()))
+
+    # Collect one row (a Series or a dict) per group and build the frame once
+    if isinstance(groupby, list):
+        index = pd.MultiIndex.from_tuples(list(groups), names=groupby)
+    else:
+        index = pd.Index(list(groups), name=groupby)
+    retval = pd.DataFrame(rows, index=index)
 
     if allow_overwrite:
         # Identify columns that would cause a conflict during the merge
@@ -464,6 +523,114 @@ def get_value(value):
     return value.iloc[0] if isinstance(value, pd.Series) else value
 
 
+def read_db(name, columns=None, **kwargs):
+    """
+    Read one of the package databases, preferring its Parquet copy over the CSV file unless the CSV file is more recent.
+
+    The CSV file is memory-mapped, and the host names, planet names and flags are parsed directly as categoricals.
+
+    Parameters
+    ----------
+    name : str
+        Name of the database in the data folder, without extension (e.g. "exo_interp").
+    columns : list of str, optional
+        Columns to read. By default, all the columns are read.
+    **kwargs
+        Additional keyword arguments passed to `pandas.read_csv`. They only apply to the CSV file, so the Parquet copy is not used when any is given.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The database.
+    """
+    path = os.path.join(ROOT, "data", name)
+    csv_path, parquet_path = f"{path}.csv", f"{path}.parquet"
+    if os.path.exists(parquet_path) and not kwargs:
+        # A CSV edited or replaced after the Parquet copy was written wins
+        if not os.path.exists(csv_path) or os.path.getmtime(
+            parquet_path
+        ) >= os.path.getmtime(csv_path):
+            logger.debug(f"Reading {parquet_path}")
+            return pd.read_parquet(parquet_path, columns=columns)
+        logger.warning(f"{parquet_path} is older than {csv_path}, reading the CSV file")
+    logger.debug(f"Reading {csv_path}")
+    dtype = {"hostname": "category", "pl_name": "category", "flag": "category"}
+    return pd.read_csv(
+        csv_path, memory_map=True, dtype=dtype, usecols=columns, **kwargs
+    )
+
+
+def write_db(df, out_path):
+    """
+    Store a database as CSV and, next to it, as a zstd-compressed Parquet file, which is faster to reload.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The database.
+    out_path : str
+        Path of the CSV file. The Parquet file has the same path with the .parquet extension.
+    """
+    # Write the Parquet copy last, so that read_db does not find it older than the CSV
+    df.to_csv(out_path, index=False)
+    df.to_parquet(
+        os.path.splitext(out_path)[0] + ".parquet", compression="zstd", index=False
+    )
+
+
+# Bit associated with each interpolation flag suffix, in the order in which the
+# suffixes are appended to the flag: 1 eccentricity, 2 mass, 3 inclination,
+# 4 semi-major axis, 5 true obliquity
+FLAG_BITS = {
+    suffix: np.uint32(1 << k)
+    for k, suffix in enumerate(
+        [
+            "1+-",
+            "1+",
+            "1-",
+            "2+-",
+            "2+",
+            "2-",
+            "3+",
+            "3-",
+            "3d+-",
+            "3+-",
+            "4+",
+            "4-",
+            "5+",
+            "5-",
+            "5d+-",
+            "5+-",
+        ]
+    )
+}
+
+
+def decode_flag_bits(bits):
+    """
+    Translate the interpolation flag bits into the human-readable flag, e.g. "01+-3+-".
+
+    Parameters
+    ----------
+    bits : int or array_like
+        Flag bits, as accumulated from the values of **FLAG_BITS**.
+
+    Returns
+    -------
+    str or np.ndarray
+        The flag, or an object array of flags if `bits` is an array.
+    """
+    if np.ndim(bits) == 0:
+        return decode_flag_bits([bits])[0]
+
+    bits = np.asarray(bits, dtype=np.uint32)
+    out = np.full(bits.shape, "0", dtype=object)
+    for suffix, bit in FLAG_BITS.items():
+        out += np.where(bits & bit, suffix, "")
+
+    return out
+
+
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import truncnorm, norm
@@ -477,14 +644,14 @@ def sample_trunc_normal(
 
     Parameters
     ----------
-    mu, sigma : float
-        Mean and standard deviation of the underlying normal.
-    lower, upper : float
+    mu, sigma : float or array_like
+        Mean and standard deviation of the underlying normal. Arrays are broadcast against the output shape.
+    lower, upper : float or array_like
         Truncation bounds (inclusive).
-    n : int
-        Number of samples to draw.
-    random_state : int | None
-        Seed for reproducibility.
+    n : int or tuple of ints
+        Number of samples to draw, or shape of the output array.
+    random_state : int | np.random.Generator | None
+        Seed (or generator) for reproducibility.
 
     Example
     -------
@@ -518,13 +685,9 @@ def sample_trunc_normal(
 
     Returns
     -------
-    samples : ndarray, shape (n,)
+    samples : ndarray, shape (n,) or n
     """
-    if random_state is not None:
-        np.random.seed(random_state)
-
     # Convert bounds to standard normal units
-    if sigma == 0:
-        sigma = 1e-9
+    sigma = np.where(sigma == 0, 1e-9, sigma)
     a, b = (lower - mu) / sigma, (upper - mu) / sigma
-    return truncnorm.rvs(a, b, loc=mu, scale=sigma, size=n)
+    return truncnorm.rvs(a, b, loc=mu, scale=sigma, size=n, random_state=random_state)
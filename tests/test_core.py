@@ -0,0 +1,89 @@
+import numba
+import numpy as np
+import pytest
+
+from exonamd.core import compute_amdk
+from exonamd.core import compute_namd
+from exonamd.core import compute_namd_mc
+from exonamd.core import sample_namd_rejection
+
+
+def _amdk(m, e, di, a):
+    # Direct form of the AMD, as in the original NumPy implementation
+    return m * np.sqrt(a) * (1 - np.sqrt(1 - e**2) * np.cos(np.deg2rad(di)))
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(42)
+    shape = (3, 1000)
+    return (
+        rng.uniform(1.0, 300.0, shape),
+        rng.uniform(0.0, 0.9, shape),
+        rng.uniform(0.0, 90.0, shape),
+        rng.uniform(0.01, 5.0, shape),
+    )
+
+
+def test_compute_amdk_scalar():
+    assert compute_amdk(10.0, 0.1, 2.0, 0.5) == pytest.approx(
+        _amdk(10.0, 0.1, 2.0, 0.5)
+    )
+
+
+def test_compute_amdk_2d(samples):
+    out = compute_amdk(*samples)
+
+    assert out.shape == samples[0].shape
+    np.testing.assert_allclose(out, _amdk(*samples), rtol=1e-12)
+
+
+def test_compute_amdk_2d_broadcast(samples):
+    m, _, _, a = samples
+    e = np.array([[0.1], [0.05], [0.2]])
+    di = np.array([[1.0], [3.0], [0.5]])
+
+    out = compute_amdk(m, e, di, a)
+
+    np.testing.assert_allclose(out, _amdk(m, e, di, a), rtol=1e-12)
+
+
+def test_compute_amdk_2d_non_contiguous(samples):
+    m, e, di, a = (x.T.copy().T for x in samples)
+
+    np.testing.assert_allclose(compute_amdk(m, e, di, a), _amdk(*samples), rtol=1e-12)
+
+
+def test_compute_amdk_nan():
+    m = np.array([[1.0, np.nan], [2.0, 3.0]])
+
+    out = compute_amdk(m, 0.1, 1.0, 1.0)
+
+    assert np.isnan(out[0, 1])
+    assert np.isfinite(out).sum() == 3
+
+
+def test_compute_namd_mc(samples):
+    m, e, di, a = samples
+    amdk = compute_amdk(m, e, di, a)
+
+    out = compute_namd_mc(m, e, di, a, amdk_factor=0.5)
+
+    np.testing.assert_allclose(out, compute_namd(0.5 * amdk, m, np.sqrt(a)), rtol=1e-12)
+
+
+def test_sample_namd_rejection_threads():
+    loc = np.array([[10.0, 20.0], [0.05, 0.1], [1.0, 2.0], [0.1, 0.5]])
+    scale = np.array([[1.0, 2.0], [0.05, 0.05], [1.0, 1.0], [0.01, 0.05]])
+
+    out = sample_namd_rejection(loc, scale, 90.0, 10000, seed=42)
+    n_threads = numba.get_num_threads()
+    numba.set_num_threads(1)
+    try:
+        serial = sample_namd_rejection(loc, scale, 90.0, 10000, seed=42)
+    finally:
+        numba.set_num_threads(n_threads)
+
+    assert 0 < len(out) < 10000
+    assert np.all(np.isfinite(out))
+    np.testing.assert_array_equal(out, serial)
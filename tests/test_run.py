@@ -0,0 +1,51 @@
+import subprocess
+import sys
+import textwrap
+
+from exonamd.run import calc_namd
+from exonamd.run import interp_db
+from exonamd.utils import read_db
+
+
+def test_calc_namd_core(tmp_path):
+    df = read_db("exo")
+    df = df[df["hostname"].isin(df["hostname"].unique()[:50])]
+    df = interp_db(df, out_path=str(tmp_path / "exo_interp.csv"))
+
+    core = calc_namd(df, save=False, Npt=100)
+    # Without the flag bits, the core sample is selected from the flags
+    core_flags = calc_namd(df.drop(columns="flag_bits"), save=False, Npt=100)
+
+    assert len(core) > 0
+    assert core["flag"].isin(["0", "05+", "05-", "05+5-", "05d+-", "05+-"]).all()
+    assert core["pl_name"].tolist() == core_flags["pl_name"].tolist()
+
+
+def test_calc_namd_n_jobs_exits(tmp_path):
+    # The workers are started after the serial run has started the numba threads,
+    # which used to leave the interpreter hanging at exit
+    script = tmp_path / "calc_namd.py"
+    script.write_text(
+        textwrap.dedent(
+            """
+            from exonamd.run import calc_namd
+            from exonamd.utils import read_db
+
+
+            def main():
+                df = read_db("exo_interp")
+                df = df[df["hostname"].isin(df["hostname"].unique()[:10])]
+                calc_namd(df, save=False, core=False, Npt=1000)
+                df = calc_namd(df, save=False, core=False, Npt=1000, n_jobs=2)
+                assert df["namd_rel_q50"].notna().any()
+
+
+            if __name__ == "__main__":
+                main()
+            """
+        )
+    )
+
+    result = subprocess.run([sys.executable, str(script)], timeout=300)
+
+    assert result.returncode == 0
@@ -0,0 +1,221 @@
+import astropy.constants as cc
+import astropy.units as u
+import numpy as np
+import pandas as pd
+import pytest
+
+from exonamd.solve import solve_a_period
+from exonamd.solve import solve_a_rs
+from exonamd.solve import solve_amdk
+from exonamd.solve import solve_namd
+from exonamd.solve import solve_namd_mc
+from exonamd.solve import solve_rprs
+from exonamd.solve import solve_values
+from exonamd.utils import read_db
+
+
+def _host(eccen, eccen_sigma):
+    # Only the eccentricities can be unphysical: the other parameters are well within their bounds
+    n_pl = len(eccen)
+    out = {"hostname": ["host"] * n_pl}
+    for col, loc, scale in [
+        ("pl_bmasse", np.full(n_pl, 10.0), np.full(n_pl, 1e-3)),
+        ("pl_orbeccen", np.asarray(eccen), np.asarray(eccen_sigma)),
+        ("pl_relincl", np.full(n_pl, 1.0), np.full(n_pl, 1e-3)),
+        ("pl_trueobliq", np.full(n_pl, 1.0), np.full(n_pl, 1e-3)),
+        ("pl_orbsmax", np.linspace(0.1, 1.0, n_pl), np.full(n_pl, 1e-3)),
+    ]:
+        out[col] = loc
+        out[f"{col}err1"] = scale
+        out[f"{col}err2"] = -scale
+    return pd.DataFrame(out)
+
+
+@pytest.mark.parametrize("kind", ["rel", "abs"])
+def test_solve_namd_mc_rejection_planet_below_threshold(kind):
+    # The second planet has about 2.3% physical samples, i.e. 46 out of 2000
+    host = _host([0.3, -0.2], [0.01, 0.1])
+
+    out = solve_namd_mc(host, kind, 2000, 100, use_trunc_normal=False, seed=42)
+
+    assert np.isnan(out[f"namd_{kind}_q50"])
+
+
+@pytest.mark.parametrize("kind", ["rel", "abs"])
+def test_solve_namd_mc_rejection_joint_below_threshold(kind):
+    # Each planet has about 1000 physical samples out of 2000, but only about 500
+    # samples are physical for both
+    host = _host([0.0, 0.0], [0.1, 0.1])
+
+    below = solve_namd_mc(host, kind, 2000, 800, use_trunc_normal=False, seed=42)
+    above = solve_namd_mc(host, kind, 2000, 300, use_trunc_normal=False, seed=42)
+
+    assert np.isnan(below[f"namd_{kind}_q50"])
+    assert np.isfinite(above[f"namd_{kind}_q50"])
+    assert above[f"namd_{kind}_q16"] <= above[f"namd_{kind}_q50"]
+    assert above[f"namd_{kind}_q50"] <= above[f"namd_{kind}_q84"]
+
+
+def test_solve_namd_mc_trunc_normal_ignores_threshold():
+    host = _host([0.3, -0.2], [0.01, 0.1])
+
+    out = solve_namd_mc(host, "rel", 2000, 100, use_trunc_normal=True, seed=42)
+
+    assert np.isfinite(out["namd_rel_q50"])
+
+
+def _namd(host, kind):
+    # Per-system NAMD, as in the original row-wise implementation
+    di = host["pl_relincl"] if kind == "rel" else host["pl_trueobliq"]
+    m, e, a = host["pl_bmasse"], host["pl_orbeccen"], host["pl_orbsmax"]
+    amdk = m * np.sqrt(a) * (1 - np.sqrt(1 - e**2) * np.cos(np.deg2rad(di)))
+    if kind == "abs":
+        amdk /= 2.0
+    return np.sum(amdk) / np.sum(m * np.sqrt(a))
+
+
+@pytest.fixture(scope="module")
+def exo_interp():
+    return read_db("exo_interp")
+
+
+def test_solve_amdk(exo_interp):
+    out = solve_amdk(exo_interp, "abs")
+
+    assert out.index.equals(exo_interp.index)
+    np.testing.assert_allclose(out["sqrt_sma"], np.sqrt(exo_interp["pl_orbsmax"]))
+
+
+@pytest.mark.parametrize("kind", ["rel", "abs"])
+def test_solve_namd(exo_interp, kind):
+    out = solve_namd(exo_interp, kind)
+
+    expected = exo_interp.groupby("hostname", observed=True)[exo_interp.columns].apply(
+        _namd, kind
+    )
+    expected = expected.loc[exo_interp["hostname"]].to_numpy()
+    np.testing.assert_allclose(out[f"namd_{kind}"], expected, rtol=1e-10)
+
+
+def test_solve_namd_nan():
+    host = _host([0.1, 0.2], [0.01, 0.01])
+    host["pl_orbeccen"] = [0.1, np.nan]
+    other = _host([0.1], [0.01]).assign(hostname="other")
+    df = pd.concat([host, other], ignore_index=True)
+
+    out = solve_namd(df, ["rel", "abs"])
+
+    assert out.loc[:1].isna().all().all()
+    assert out.loc[2].notna().all()
+
+
+def test_solve_a_rs_scalar():
+    sma, rstar, ars = solve_a_rs(np.nan, 1.0, 215.0)
+
+    assert isinstance(sma, float)
+    assert sma == pytest.approx(1.0, rel=1e-3)
+    assert (rstar, ars) == (1.0, 215.0)
+
+
+def test_solve_rprs_scalar():
+    rplanet, rstar, rprs = solve_rprs(11.2, 1.0, np.nan)
+
+    assert isinstance(rprs, float)
+    assert rprs == pytest.approx(0.1027, rel=1e-3)
+
+
+def test_solve_a_period_scalar():
+    period, sma, mstar = solve_a_period(365.25, 1.0, np.nan)
+
+    assert isinstance(mstar, float)
+    assert mstar == pytest.approx(1.0, rel=1e-3)
+
+
+def test_solve_a_rs_masks_updated_in_place():
+    sma = np.array([np.nan, 1.0, np.nan])
+    rstar = np.array([1.0, 1.0, np.nan])
+    ars = np.array([215.0, 215.0, 215.0])
+    isnan = np.isnan(sma), np.isnan(rstar), np.isnan(ars)
+
+    sma, rstar, ars = solve_a_rs(sma, rstar, ars, isnan=isnan)
+
+    # Only the first row had a single missing value
+    assert np.isfinite(sma[0])
+    assert isnan[0].tolist() == [False, False, True]
+    assert isnan[1].tolist() == [False, False, True]
+    assert not isnan[2].any()
+
+
+def _solve_values_rowwise(row):
+    # Row-wise solver of the original implementation, with astropy units
+    sma, ars, rstar, rplanet, rprs, period, mstar = row.to_numpy(dtype=float)
+    two_pi_G = 2.0 * np.pi / np.sqrt(cc.G)
+
+    def a_rs():
+        nonlocal sma, rstar, ars
+        if np.isnan(sma):
+            sma = (ars * rstar * u.R_sun).to(u.au).value
+        elif np.isnan(rstar):
+            rstar = (sma * u.au / ars).to(u.R_sun).value
+        elif np.isnan(ars):
+            ars = (sma * u.au / (rstar * u.R_sun).to(u.au)).value
+
+    def rprs_():
+        nonlocal rplanet, rstar, rprs
+        if np.isnan(rplanet):
+            rplanet = (rprs * (rstar * u.R_sun)).to(u.R_earth).value
+        elif np.isnan(rstar):
+            rstar = (rplanet * u.R_earth / rprs).to(u.R_sun).value
+        elif np.isnan(rprs):
+            rprs = (rplanet * u.R_earth / (rstar * u.R_sun).to(u.R_earth)).value
+
+    def a_period():
+        nonlocal period, sma, mstar
+        if np.isnan(mstar):
+            mstar = (sma * u.au) ** 3.0 / (period * u.day / two_pi_G) ** 2.0
+            mstar = mstar.to(u.M_sun).value
+        elif np.isnan(period):
+            period = np.sqrt((sma * u.au) ** 3.0 / (mstar * u.M_sun)) * two_pi_G
+            period = period.to(u.day).value
+        elif np.isnan(sma):
+            sma = ((period * u.day / two_pi_G) ** 2.0 * (mstar * u.M_sun)) ** (1 / 3)
+            sma = sma.to(u.au).value
+
+    # The original ranked the systems by summing np.bool_ values, which is a logical
+    # or, so they were always solved in this order, each only if one value is missing
+    for solve, values in [
+        (a_rs, lambda: (sma, ars, rstar)),
+        (rprs_, lambda: (rplanet, rprs, rstar)),
+        (a_period, lambda: (period, sma, mstar)),
+    ]:
+        if np.isnan(values()).sum() == 1:
+            solve()
+
+    return pd.Series([sma, ars, rstar, rplanet, rprs, period, mstar], index=row.index)
+
+
+def test_solve_values():
+    rng = np.random.default_rng(1)
+    n = 300
+    mstar = rng.uniform(0.3, 2.0, n)
+    rstar = rng.uniform(0.3, 3.0, n)
+    period = rng.uniform(1.0, 500.0, n)
+    sma = (mstar * (period / 365.25) ** 2) ** (1 / 3)
+    rplanet = rng.uniform(0.5, 15.0, n)
+    df = pd.DataFrame(
+        {
+            "pl_orbsmax": sma,
+            "pl_ratdor": sma * 215.03 / rstar,
+            "st_rad": rstar,
+            "pl_rade": rplanet,
+            "pl_ratror": rplanet / 109.1 / rstar,
+            "pl_orbper": period,
+            "st_mass": mstar,
+        }
+    )
+    df = df.mask(rng.random(df.shape) < 0.35)
+
+    out = solve_values(df)
+
+    expected = df.apply(_solve_values_rowwise, axis=1)
+    pd.testing.assert_frame_equal(out, expected, rtol=1e-12)
@@ -0,0 +1,156 @@
+import os
+
+import pandas as pd
+import pytest
+
+import exonamd.utils
+from exonamd.utils import FLAG_BITS
+from exonamd.utils import decode_flag_bits
+from exonamd.utils import groupby_apply_merge
+from exonamd.utils import host_alias_map
+from exonamd.utils import planet_alias_map
+from exonamd.utils import read_db
+from exonamd.utils import write_db
+
+
+def _sum_v(group):
+    return {"s": group["v"].sum()}
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "a": [1, 1, 2, 2],
+            "b": ["x", "y", "x", "x"],
+            "v": [1.0, 2.0, 3.0, 4.0],
+        }
+    )
+
+
+def test_groupby_apply_merge(df):
+    out = groupby_apply_merge(df, "a", _sum_v)
+
+    assert out["s"].tolist() == [3.0, 3.0, 7.0, 7.0]
+
+
+def test_groupby_apply_merge_list_keys(df):
+    out = groupby_apply_merge(df, ["a", "b"], _sum_v)
+
+    assert out is not None
+    assert out["s"].tolist() == [1.0, 2.0, 7.0, 7.0]
+
+
+def test_groupby_apply_merge_overwrite(df):
+    df["s"] = 0.0
+    out = groupby_apply_merge(df, "a", _sum_v, allow_overwrite=True)
+
+    assert out["s"].tolist() == [3.0, 3.0, 7.0, 7.0]
+
+
+def test_groupby_apply_merge_n_jobs(df):
+    serial = groupby_apply_merge(df, ["a", "b"], _sum_v)
+    parallel = groupby_apply_merge(df, ["a", "b"], _sum_v, n_jobs=2)
+
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+def test_decode_flag_bits():
+    bits = [
+        0,
+        FLAG_BITS["5d+-"],
+        FLAG_BITS["1+"] | FLAG_BITS["1-"] | FLAG_BITS["3d+-"] | FLAG_BITS["5+-"],
+    ]
+
+    assert decode_flag_bits(bits).tolist() == ["0", "05d+-", "01+1-3d+-5+-"]
+    assert decode_flag_bits(FLAG_BITS["2+-"]) == "02+-"
+
+
+@pytest.fixture
+def db(df, tmp_path, monkeypatch):
+    monkeypatch.setattr(exonamd.utils, "ROOT", str(tmp_path))
+    (tmp_path / "data").mkdir()
+    write_db(df, str(tmp_path / "data" / "db.csv"))
+    return tmp_path / "data"
+
+
+def test_read_db_parquet(df, db):
+    out = read_db("db")
+
+    pd.testing.assert_frame_equal(out, df)
+
+
+def test_read_db_columns(df, db):
+    from_parquet = read_db("db", columns=["a", "v"])
+    os.remove(db / "db.parquet")
+    from_csv = read_db("db", columns=["a", "v"])
+
+    pd.testing.assert_frame_equal(from_parquet, df[["a", "v"]])
+    pd.testing.assert_frame_equal(from_csv, df[["a", "v"]])
+
+
+def test_read_db_stale_parquet(df, db):
+    csv_path = db / "db.csv"
+    df.assign(v=-df["v"]).to_csv(csv_path, index=False)
+    mtime = os.path.getmtime(db / "db.parquet") + 1.0
+    os.utime(csv_path, (mtime, mtime))
+
+    out = read_db("db")
+
+    assert out["v"].tolist() == (-df["v"]).tolist()
+
+
+def test_read_db_csv_kwargs(df, db):
+    out = read_db("db", nrows=2)
+
+    assert len(out) == 2
+
+
+def _update_host(host, aliases):
+    # Row-wise host update of the original implementation
+    for key, item in aliases.items():
+        if host in item["host_aliases"]:
+            return key
+    return host
+
+
+def _update_planet(planet, aliases):
+    # Row-wise planet update of the original implementation
+    for key, item in aliases.items():
+        planet_aliases = item["planet_aliases"]
+        if planet in planet_aliases.keys():
+            name = planet_aliases[planet]
+            if name[: len(key)] != key:
+                return key + name[-2:]
+            elif planet != name:
+                return name
+    return planet
+
+
+def test_alias_maps():
+    aliases = {
+        "HD 1": {
+            "host_aliases": ["HD 1", "HIP 1", "GJ 9"],
+            "planet_aliases": {
+                "HD 1 b": "HD 1 b",
+                "HIP 1 c": "HD 1 c",
+                "GJ 9 b": "X b",
+            },
+        },
+        "GJ 9": {
+            "host_aliases": ["GJ 9", "TOI 9"],
+            "planet_aliases": {"HD 1 b": "GJ 9 b", "TOI 9 b": "GJ 9 b"},
+        },
+    }
+    hosts = ["HD 1", "HIP 1", "GJ 9", "TOI 9", "Kepler-1"]
+    planets = ["HD 1 b", "HIP 1 c", "GJ 9 b", "TOI 9 b", "Kepler-1 b"]
+
+    host_map = host_alias_map(aliases)
+    planet_map = planet_alias_map(aliases)
+
+    assert [host_map.get(h, h) for h in hosts] == [
+        _update_host(h, aliases) for h in hosts
+    ]
+    assert [planet_map.get(p, p) for p in planets] == [
+        _update_planet(p, aliases) for p in planets
+    ]